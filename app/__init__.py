@@ -10,12 +10,65 @@ login_manager = LoginManager()
 def create_app():
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'dev-secret-key-change-this-in-prod'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-    
     import os
-    app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'app/static/uploads')
+    # DATABASE_URL lets scripts such as the benchmarks run against their own database
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.getcwd(), 'app/static/uploads')
     # Ensure upload folder exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    # Template fragment cache: 'lru' (per process), 'sqlite' (shared by workers on this host) or 'none'
+    app.config['FRAGMENT_CACHE'] = 'lru'
+
+    # Per-request query counting, N+1 and slow-query logging (app/query_stats.py)
+    app.config['QUERY_STATS'] = os.environ.get('QUERY_STATS', '1') == '1'
+    app.config['QUERY_STATS_SLOW_MS'] = 200
+    app.config['QUERY_STATS_N_PLUS_ONE'] = 10
+    app.config['QUERY_STATS_HEADERS'] = os.environ.get('QUERY_STATS_HEADERS') == '1' # Always send X-Query-Count
+
+    # Prometheus metrics at /metrics (needs prometheus_client; see app/metrics.py and gunicorn.conf.py)
+    app.config['METRICS'] = os.environ.get('METRICS', '1') == '1'
+    app.config['METRICS_DIR'] = os.path.join(app.instance_path, 'prometheus') # Unless PROMETHEUS_MULTIPROC_DIR is set
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') # Bearer token for scrapers; admins can always read it
+
+    # Sampling profiler (app/profiling.py): fraction of requests to profile; admins can also send X-Profile: 1
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    app.config['PROFILE_INTERVAL_MS'] = 5
+    app.config['PROFILE_KEEP'] = 50 # Most recent profiles kept per endpoint
+
+    # Learning activity log (app/activity.py): buffered in process, written in batches
+    app.config['ACTIVITY_LOG'] = os.environ.get('ACTIVITY_LOG', '1') == '1'
+    app.config['ACTIVITY_BATCH_SIZE'] = 500
+    app.config['ACTIVITY_FLUSH_SECONDS'] = 2.0
+    app.config['ACTIVITY_MAX_PENDING'] = 100000 # Events kept in memory while the database is unreachable
+
+    # Video heartbeats: the player reports its position every WATCH_HEARTBEAT_SECONDS; positions are
+    # coalesced in memory per student and lesson and written every WATCH_FLUSH_SECONDS
+    app.config['WATCH_HEARTBEAT_SECONDS'] = 15
+    app.config['WATCH_FLUSH_SECONDS'] = 10.0
+    app.config['WATCH_MAX_PENDING'] = 100000 # Distinct (student, lesson) positions kept in memory
+    app.config['WATCH_COMPLETE_RATIO'] = 0.9 # Share of the video after which the lesson is marked complete
+
+    # Quiz attempt retention: per student and quiz, the latest N attempts and the best one stay in
+    # QuizResult; `flask compact-quiz-results` (or its job) archives the rest, this many students per batch
+    app.config['QUIZ_RESULTS_KEEP_LATEST'] = int(os.environ.get('QUIZ_RESULTS_KEEP_LATEST', '3'))
+    app.config['QUIZ_ARCHIVE_BATCH_USERS'] = 200
+
+    # Admin notifications read by every admin are deleted after this many days, in batches of this many rows
+    app.config['NOTIFICATION_RETENTION_DAYS'] = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '30'))
+    app.config['NOTIFICATION_ARCHIVE_BATCH'] = 500
+
+    # Compiled templates are kept on disk so workers don't recompile them on every boot
+    from jinja2 import FileSystemBytecodeCache
+    from app.fragment_cache import FragmentCacheExtension
+    jinja_cache_dir = os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(jinja_cache_dir, exist_ok=True)
+    app.jinja_options = {
+        **app.jinja_options,
+        'extensions': [FragmentCacheExtension],
+        'bytecode_cache': FileSystemBytecodeCache(jinja_cache_dir),
+    }
     
     db.init_app(app)
     bcrypt.init_app(app)
@@ -30,6 +83,57 @@ def create_app():
     app.register_blueprint(auth)
     app.register_blueprint(admin_bp)
 
+    from app.storage import gc_uploads_command
+    app.cli.add_command(gc_uploads_command)
+
+    from app.jobs import jobs_bp, jobs_worker_command
+    app.register_blueprint(jobs_bp)
+    app.cli.add_command(jobs_worker_command)
+
+    from app.leaderboard import rebuild_leaderboards_command
+    app.cli.add_command(rebuild_leaderboards_command)
+
+    from app.rollups import rollup_stats_command
+    app.cli.add_command(rollup_stats_command)
+
+    from app.quiz_archive import compact_quiz_results_command
+    app.cli.add_command(compact_quiz_results_command)
+
+    from app.notifications import archive_notifications_command
+    app.cli.add_command(archive_notifications_command)
+
+    from app.fragment_cache import make_cache
+    from app.versions import data_version
+    app.jinja_env.fragment_cache = make_cache(app)
+    app.add_template_global(data_version)
+
+    from app.images import image_srcset
+    app.add_template_global(image_srcset)
+
+    from app.assets import assets_bp, asset_urls, immutable_upload_headers, build_assets_command
+    app.register_blueprint(assets_bp)
+    app.add_template_global(asset_urls)
+    app.after_request(immutable_upload_headers)
+    app.cli.add_command(build_assets_command)
+
+    from app.api import api_bp
+    app.register_blueprint(api_bp)
+
+    from app.query_stats import init_query_stats
+    init_query_stats(app)
+
+    from app.metrics import init_metrics
+    init_metrics(app)
+
+    from app.profiling import init_profiling
+    init_profiling(app)
+
+    from app.activity import init_activity
+    init_activity(app)
+
+    from app.watch import init_watch
+    init_watch(app)
+
     with app.app_context():
         db.create_all()
 
@@ -0,0 +1,119 @@
+import atexit
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app, has_request_context
+from flask_login import current_user
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models import ActivityEvent
+
+# Learning activity log. Views call log_event(), which only appends a row to an in-process
+# buffer; a background thread writes the buffer with one executemany INSERT on its own
+# connection every ACTIVITY_FLUSH_SECONDS, or as soon as ACTIVITY_BATCH_SIZE events are
+# waiting. Requests never wait for (or commit) the log. Whatever is still buffered is written
+# when the process exits; a hard kill loses at most one interval of events.
+
+# Event types (ActivityEvent.type) and what ActivityEvent.object_id refers to
+LOGIN = 1 # -
+LESSON_VIEW = 2 # lesson
+LESSON_COMPLETE = 3 # lesson
+LESSON_UNCOMPLETE = 4 # lesson
+QUIZ_START = 5 # quiz
+QUIZ_SUBMIT = 6 # quiz result
+SUBMISSION_DOWNLOAD = 7 # submission
+RESOURCE_DOWNLOAD = 8 # assignment
+STUDENT_APPROVED = 9 # user (the approved student; user_id is the admin)
+
+EVENT_NAMES = {
+    LOGIN: 'login',
+    LESSON_VIEW: 'lesson_view',
+    LESSON_COMPLETE: 'lesson_complete',
+    LESSON_UNCOMPLETE: 'lesson_uncomplete',
+    QUIZ_START: 'quiz_start',
+    QUIZ_SUBMIT: 'quiz_submit',
+    SUBMISSION_DOWNLOAD: 'submission_download',
+    RESOURCE_DOWNLOAD: 'resource_download',
+    STUDENT_APPROVED: 'student_approved',
+}
+
+
+class EventBuffer:
+    def __init__(self, app, batch_size, interval, max_pending):
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._events = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None # The flusher is started lazily so forked workers each get their own
+
+    def add(self, event):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            if len(self._events) >= self.max_pending:
+                self.dropped += 1 # The database has been unreachable for a while; don't grow without bound
+                return
+            self._events.append(event)
+            full = len(self._events) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written."""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(ActivityEvent.__table__.insert(), events)
+        except SQLAlchemyError:
+            self.app.logger.exception('Could not write %d activity events', len(events))
+            with self._lock:
+                room = max(self.max_pending - len(self._events), 0)
+                self._events[:0] = events[-room:] if room else []
+            return 0
+        return len(events)
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._events = [] # Events inherited from the parent are the parent's to write
+        threading.Thread(target=self._run, name='activity-flusher', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+
+def log_event(event_type, object_id=None, user_id=None):
+    """Record an activity event for the current user (or user_id) without touching the database."""
+    buffer = current_app.extensions.get('activity')
+    if buffer is None:
+        return
+    if user_id is None and has_request_context() and current_user.is_authenticated:
+        # From the identity key: current_user.id would reload a user expired by the view's commit
+        user_id = db.inspect(current_user._get_current_object()).identity[0]
+    buffer.add({'type': event_type, 'user_id': user_id, 'object_id': object_id, 'created_at': datetime.utcnow()})
+
+
+def flush_events(app=None):
+    buffer = (app or current_app).extensions.get('activity')
+    return buffer.flush() if buffer else 0
+
+
+def init_activity(app):
+    if not app.config.get('ACTIVITY_LOG'):
+        return
+    app.extensions['activity'] = EventBuffer(app, app.config.get('ACTIVITY_BATCH_SIZE', 500),
+                                             app.config.get('ACTIVITY_FLUSH_SECONDS', 2.0),
+                                             app.config.get('ACTIVITY_MAX_PENDING', 100000))
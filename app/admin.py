@@ -2,8 +2,12 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from werkzeug.utils import secure_filename
 import os
 from flask_login import login_required, current_user
-from app import db, bcrypt
+from app import db, bcrypt, activity
 from app.models import User
+from app.images import schedule_derivatives
+from app.jobs import job, enqueue
+from app.leaderboard import rebuild_scores, remove_scores, record_grade_changes
+from app.resume import refresh_resume_points, remove_resume_points
 
 admin_bp = Blueprint('admin_bp', __name__, url_prefix='/admin')
 
@@ -25,6 +29,8 @@ def students():
 @admin_bp.route('/student/<int:user_id>/approve', methods=['POST'])
 def approve_student(user_id):
     user = User.query.get_or_404(user_id)
+    if user.status != 'approved':
+        activity.log_event(activity.STUDENT_APPROVED, user.id) # Counted by the daily signup rollup
     user.status = 'approved'
     db.session.commit()
     flash(f'Student {user.full_name} approved!', 'success')
@@ -65,48 +71,24 @@ def categories():
 def delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     
-    try:
-        # Recursive deletion of courses in this category
-        courses = Course.query.filter_by(category_id=category.id).all()
-        for course in courses:
-            # Reusing the logic from delete_course would be ideal, but for now copying the critical parts
-            # to ensure clean cascade.
-            # Ideally, refactor delete_course logic into a helper function later.
-            
-            for module in course.modules:
-                for lesson in module.lessons:
-                    # 1. Delete Progress
-                    from app.models import LessonProgress, QuizResult, Submission
-                    LessonProgress.query.filter_by(lesson_id=lesson.id).delete()
-                    
-                    # 2. Delete Quiz & Results
-                    if lesson.quiz:
-                        QuizResult.query.filter_by(quiz_id=lesson.quiz.id).delete()
-            
-                    # 3. Delete Assignment & Submissions
-                    if lesson.assignment:
-                        Submission.query.filter_by(assignment_id=lesson.assignment.id).delete()
-                        db.session.delete(lesson.assignment)
-                    
-                    # 4. Delete Lesson
-                    db.session.delete(lesson)
-                
-                # 5. Delete Module
-                db.session.delete(module)
-            
-            # Clear enrollments
-            course.students = []
-            db.session.delete(course)
+    # Deleting every course, lesson, result and submission can take a while, so it runs on the job worker
+    enqueue('delete_category', category_id=category.id)
+    db.session.commit()
+    flash(f'Category "{category.name}" and all its courses are being deleted.', 'success')
+    return redirect(url_for('admin_bp.categories'))
 
-        db.session.delete(category)
-        db.session.commit()
-        flash(f'Category "{category.name}" and all its courses were successfully deleted.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        print(e)
-        flash('An error occurred while deleting the category.', 'danger')
+@job('delete_category', concurrency=1)
+def delete_category_job(category_id):
+    category = Category.query.get(category_id)
+    if not category:
+        return {'deleted_courses': 0}
 
-    return redirect(url_for('admin_bp.categories'))
+    courses = Course.query.filter_by(category_id=category.id).all()
+    for course in courses:
+        delete_course_tree(course)
+
+    db.session.delete(category)
+    return {'deleted_courses': len(courses)}
 
 # --- Courses ---
 @admin_bp.route('/courses', methods=['GET', 'POST'])
@@ -121,16 +103,10 @@ def courses():
         if 'thumbnail_file' in request.files:
             file = request.files['thumbnail_file']
             if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                # Ensure unique filename to avoid overwrites (timestamp prefix)
-                from datetime import datetime
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
                 try:
-                    file.save(file_path)
-                    thumbnail_url = filename # Store filename, easy to distinguish from full URL
+                    # Content-addressed, so re-uploading the same image never overwrites or duplicates
+                    thumbnail_url = store_upload(file) # Store path, easy to distinguish from full URL
+                    schedule_derivatives(thumbnail_url)
                 except Exception as e:
                     print(f"Error saving course thumbnail: {e}")
                     flash('Error uploading image', 'warning')
@@ -154,43 +130,46 @@ def courses():
     categories = Category.query.all()
     return render_template('admin/courses.html', courses=courses, categories=categories)
 
+def delete_course_tree(course):
+    # Manual Cascade Deletion (shared by delete_course and the delete_category job)
+    from app.models import LessonProgress, QuizResult, QuizResultArchive, Submission
+    for module in course.modules:
+        for lesson in module.lessons:
+            # 1. Delete Progress
+            LessonProgress.query.filter_by(lesson_id=lesson.id).delete()
+            
+            # 2. Delete Quiz & Results
+            # (Questions are removed through the quiz's cascade when the lesson goes)
+            if lesson.quiz:
+                QuizResult.query.filter_by(quiz_id=lesson.quiz.id).delete()
+                QuizResultArchive.query.filter_by(quiz_id=lesson.quiz.id).delete()
+
+            # 3. Delete Assignment & Submissions
+            if lesson.assignment:
+                release_assignment_files(lesson.assignment)
+                Submission.query.filter_by(assignment_id=lesson.assignment.id).delete()
+                db.session.delete(lesson.assignment)
+            
+            # 4. Delete Lesson
+            db.session.delete(lesson)
+        
+        # 5. Delete Module
+        db.session.delete(module)
+
+    # 6. Delete Enrollments (Many-to-Many not automatically handled unless cascade set)
+    course.students = [] 
+    remove_scores(course.id)
+    remove_resume_points(course.id)
+    release_upload(course.thumbnail_url)
+
+    db.session.delete(course)
+
 @admin_bp.route('/course/<int:course_id>/delete', methods=['POST'])
 def delete_course(course_id):
     course = Course.query.get_or_404(course_id)
     
     try:
-        # Manual Cascade Deletion
-        for module in course.modules:
-            for lesson in module.lessons:
-                # 1. Delete Progress
-                from app.models import LessonProgress, QuizResult, Submission
-                LessonProgress.query.filter_by(lesson_id=lesson.id).delete()
-                
-                # 2. Delete Quiz & Results
-                if lesson.quiz:
-                    QuizResult.query.filter_by(quiz_id=lesson.quiz.id).delete()
-                    # Questions cascade deleted by model if quiz deleted, but lesson relationship handles quiz orphan?
-                    # Model says: lesson = db.relationship('Lesson', backref=db.backref('quiz', uselist=False, cascade="all, delete-orphan"))
-                    # But quiz is parent of questions with cascade.
-                    pass 
-
-                # 3. Delete Assignment & Submissions
-                if lesson.assignment:
-                    Submission.query.filter_by(assignment_id=lesson.assignment.id).delete()
-                    db.session.delete(lesson.assignment)
-                
-                # 4. Delete Lesson
-                db.session.delete(lesson)
-            
-            # 5. Delete Module
-            db.session.delete(module)
-
-        # 6. Delete Enrollments (Many-to-Many not automatically handled unless cascade set?)
-        # db.session.delete(course) handles relationships in association table if configured, 
-        # but let's clear it explicitly if needed.
-        course.students = [] 
-
-        db.session.delete(course)
+        delete_course_tree(course)
         db.session.commit()
         flash(f'Course "{course.title}" was successfully deleted.', 'success')
     except Exception as e:
@@ -202,11 +181,12 @@ def delete_course(course_id):
 
 # --- Course Content (Modules & Lessons) ---
 from app.models import Module, Lesson
+from app.funnel import course_funnel
 
 @admin_bp.route('/course/<int:course_id>/content')
 def course_content(course_id):
     course = Course.query.get_or_404(course_id)
-    return render_template('admin/course_content.html', course=course)
+    return render_template('admin/course_content.html', course=course, funnel=course_funnel(course.id))
 
 @admin_bp.route('/course/<int:course_id>/add_module', methods=['POST'])
 def add_module(course_id):
@@ -240,6 +220,8 @@ def add_lesson(module_id):
             order_index=count
         )
         db.session.add(lesson)
+        db.session.flush()
+        refresh_resume_points(module.course_id) # Students who had finished have a new lesson to continue with
         db.session.commit()
         flash('Lesson added!', 'success')
     else:
@@ -257,6 +239,7 @@ def enroll_student(user_id):
         if course:
             if course not in user.enrolled_courses:
                 user.enrolled_courses.append(course)
+                rebuild_scores(course.id, [user.id]) # Earlier results count once enrolled
                 db.session.commit()
                 flash(f'Enrolled {user.full_name} in {course.title}', 'success')
             else:
@@ -271,6 +254,8 @@ def unenroll_student(user_id, course_id):
     
     if course in user.enrolled_courses:
         user.enrolled_courses.remove(course)
+        remove_scores(course.id, user.id)
+        remove_resume_points(course.id, user.id)
         db.session.commit()
         flash(f'Removed {user.full_name} from {course.title}', 'success')
     else:
@@ -380,6 +365,8 @@ def delete_quiz(lesson_id):
     quizzes = Quiz.query.filter_by(lesson_id=lesson_id).all()
     for q in quizzes:
         db.session.delete(q)
+    db.session.flush()
+    rebuild_scores(course_id) # The quiz's results no longer count
         
     db.session.commit()
     flash('Quiz(zes) deleted successfully.', 'success')
@@ -393,7 +380,12 @@ def delete_lesson(lesson_id):
         
     lesson = Lesson.query.get_or_404(lesson_id)
     course_id = lesson.module.course.id
+    if lesson.assignment:
+        release_assignment_files(lesson.assignment)
     db.session.delete(lesson)
+    db.session.flush()
+    rebuild_scores(course_id)
+    refresh_resume_points(course_id)
     db.session.commit()
     flash('Lesson deleted successfully.', 'success')
     return redirect(url_for('admin_bp.course_content', course_id=course_id))
@@ -418,6 +410,8 @@ def quick_add_content(course_id):
             # No video_url implied
         )
         db.session.add(lesson)
+        db.session.flush()
+        refresh_resume_points(course.id)
         db.session.commit()
         
         if content_type == 'quiz':
@@ -456,10 +450,21 @@ def edit_lesson(lesson_id):
 # --- Assignments ---
 from app.models import Assignment, Submission
 from app.routes import allowed_file
+from app.storage import store_upload, release_upload
+from app.exports import stream_zip, csv_bytes
+from app.models import UploadBlob
+from flask import Response
+from datetime import datetime
 from werkzeug.utils import secure_filename
 import os
 from flask import send_file, current_app
 
+def release_assignment_files(assignment):
+    # Drop the upload references held by an assignment and its submissions before it is deleted
+    release_upload(assignment.resource_path)
+    for submission in assignment.submissions:
+        release_upload(submission.file_path)
+
 @admin_bp.route('/assignments')
 @login_required
 def all_assignments():
@@ -491,10 +496,7 @@ def add_assignment(lesson_id):
         if 'resource_file' in request.files:
             file = request.files['resource_file']
             if file and file.filename != '' and allowed_file(file.filename):
-                filename = secure_filename(f"resource_{lesson.id}_{file.filename}")
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                assignment.resource_path = filename
+                assignment.resource_path = store_upload(file)
                 
         db.session.add(assignment)
         db.session.commit()
@@ -512,26 +514,16 @@ def edit_assignment(assignment_id):
     assignment.max_score = int(request.form.get('max_score'))
     
     # Handle Resource Upload
-    print(f"DEBUG: Processing assignment edit for ID {assignment_id}")
     if 'resource_file' in request.files:
         file = request.files['resource_file']
-        print(f"DEBUG: File found in request: {file.filename}")
         if file and file.filename != '' and allowed_file(file.filename):
-            # Delete old file if exists? (Optional, good practice)
-            filename = secure_filename(f"resource_{assignment.lesson_id}_{file.filename}")
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            filename = store_upload(file)
+            release_upload(assignment.resource_path)
             assignment.resource_path = filename
-            print(f"DEBUG: File saved to {file_path}, resource_path set to {filename}")
-        else:
-            print(f"DEBUG: File validation failed. Filename: {file.filename}")
-            if file.filename != '':
-                flash('Invalid file type. Allowed: pdf, doc, zip, txt, images', 'warning')
-    else:
-        print("DEBUG: No 'resource_file' in request.files")
+        elif file.filename != '':
+            flash('Invalid file type. Allowed: pdf, doc, zip, txt, images', 'warning')
             
     db.session.commit()
-    print(f"DEBUG: Committed. Assignment resource_path is now: {assignment.resource_path}")
     flash('Assignment updated.', 'success')
     return redirect(url_for('admin_bp.course_content', course_id=assignment.lesson.module.course.id))
 
@@ -540,7 +532,10 @@ def edit_assignment(assignment_id):
 def delete_assignment(assignment_id):
     assignment = Assignment.query.get_or_404(assignment_id)
     course_id = assignment.lesson.module.course.id
+    release_assignment_files(assignment)
     db.session.delete(assignment)
+    db.session.flush()
+    rebuild_scores(course_id)
     db.session.commit()
     flash('Assignment removed.', 'success')
     return redirect(url_for('admin_bp.course_content', course_id=course_id))
@@ -551,6 +546,89 @@ def assignment_submissions(assignment_id):
     assignment = Assignment.query.get_or_404(assignment_id)
     return render_template('admin/assignment_submissions.html', assignment=assignment)
 
+@admin_bp.route('/assignment/<int:assignment_id>/submissions/download')
+@login_required
+def download_all_submissions(assignment_id):
+    assignment = Assignment.query.get_or_404(assignment_id)
+    ungraded_only = request.args.get('ungraded') == '1'
+
+    # One query for submissions, students and original file names
+    query = (db.session.query(Submission, User, UploadBlob.original_name)
+             .join(User, Submission.user_id == User.id)
+             .outerjoin(UploadBlob, UploadBlob.path == Submission.file_path)
+             .filter(Submission.assignment_id == assignment.id))
+    if ungraded_only:
+        query = query.filter(Submission.grade.is_(None))
+    rows = query.order_by(User.full_name, User.id).all()
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    entries = []
+    manifest = []
+    for submission, student, original_name in rows:
+        name = secure_filename(original_name or os.path.basename(submission.file_path)) or 'submission'
+        arcname = f"{secure_filename(student.full_name) or 'student'}_{student.id}/{name}"
+        file_path = os.path.join(upload_folder, submission.file_path)
+        found = os.path.exists(file_path)
+        if found:
+            submitted_at = submission.submitted_at or datetime.utcnow()
+            entries.append((arcname, file_path, submitted_at.timetuple()[:6]))
+        manifest.append([
+            student.id, student.full_name, student.email,
+            arcname if found else '(missing file)',
+            submission.submitted_at.strftime('%Y-%m-%d %H:%M') if submission.submitted_at else '',
+            '' if submission.grade is None else submission.grade,
+            assignment.max_score,
+            submission.feedback or '',
+        ])
+
+    header = ['student_id', 'student_name', 'email', 'file', 'submitted_at', 'grade', 'max_score', 'feedback']
+    entries.append(('grades.csv', csv_bytes(header, manifest), datetime.utcnow().timetuple()[:6]))
+
+    filename = secure_filename(f"{assignment.lesson.title}_submissions{'_ungraded' if ungraded_only else ''}.zip")
+    return Response(stream_zip(entries), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# --- Gradebook ---
+from app.gradebook import (QUIZ_MODES, gradebook_items, enrolled_students, gradebook_cells,
+                           gradebook_row, gradebook_header, iter_gradebook_rows)
+from app.exports import stream_csv, stream_xlsx
+from flask import stream_with_context
+
+GRADEBOOK_PER_PAGE = 50
+
+def _gradebook_mode():
+    mode = request.args.get('mode', 'best')
+    return mode if mode in QUIZ_MODES else 'best'
+
+@admin_bp.route('/course/<int:course_id>/gradebook')
+def course_gradebook(course_id):
+    course = Course.query.get_or_404(course_id)
+    mode = _gradebook_mode()
+    items = gradebook_items(course.id)
+    page = enrolled_students(course.id).paginate(page=request.args.get('page', 1, type=int),
+                                                 per_page=GRADEBOOK_PER_PAGE, error_out=False)
+    cells = gradebook_cells([s.id for s in page.items], items, mode)
+    rows = [(student, gradebook_row(student, items, cells)) for student in page.items]
+    return render_template('admin/gradebook.html', course=course, items=items, rows=rows, page=page, mode=mode)
+
+@admin_bp.route('/course/<int:course_id>/gradebook.<any(csv, xlsx):fmt>')
+def export_gradebook(course_id, fmt):
+    course = Course.query.get_or_404(course_id)
+    mode = _gradebook_mode()
+    items = gradebook_items(course.id)
+    header = gradebook_header(items)
+    rows = iter_gradebook_rows(course.id, items, mode)
+    filename = secure_filename(f"{course.title}_gradebook_{mode}.{fmt}") or f'gradebook.{fmt}'
+
+    # Rows are fetched a chunk at a time while the response is being sent
+    if fmt == 'csv':
+        body, mimetype = stream_csv(header, rows), 'text/csv'
+    else:
+        body = stream_xlsx(header, rows, sheet_name='Gradebook', date_time=datetime.utcnow().timetuple()[:6])
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @admin_bp.route('/submission/<int:submission_id>/grade', methods=['POST'])
 @login_required
 def grade_submission(submission_id):
@@ -559,6 +637,8 @@ def grade_submission(submission_id):
     feedback = request.form.get('feedback')
     
     if grade:
+        record_grade_changes(submission.assignment.lesson.module.course_id,
+                             [(submission.user_id, submission.grade, int(grade))])
         submission.grade = int(grade)
         submission.feedback = feedback
         db.session.commit()
@@ -567,6 +647,183 @@ def grade_submission(submission_id):
     return redirect(url_for('admin_bp.assignment_submissions', assignment_id=submission.assignment.id))
 
 
+# --- Bulk grading ---
+import csv
+import io
+from app.versions import bump_version
+
+BULK_GRADE_LIMIT = 5000
+
+def _parse_grade_rows(text):
+    """Rows of a pasted table or CSV as dicts. Tab-separated input (copied from a spreadsheet)
+    is accepted too; without a header row the columns are submission_id, grade, feedback."""
+    lines = text.strip().splitlines()
+    if not lines:
+        return []
+    delimiter = '\t' if '\t' in lines[0] else ','
+    reader = csv.reader(lines, delimiter=delimiter)
+    first = [c.strip().lower() for c in next(reader)]
+    if 'grade' in first:
+        columns = first
+    else:
+        columns = ['submission_id', 'grade', 'feedback']
+        reader = csv.reader(lines, delimiter=delimiter)
+    return [dict(zip(columns, row)) for row in reader if any(c.strip() for c in row)]
+
+@admin_bp.route('/assignment/<int:assignment_id>/grades', methods=['POST'])
+def bulk_grade_submissions(assignment_id):
+    """Grade many submissions at once.
+
+    Accepts JSON {"grades": [{"submission_id", "grade", "feedback"}, ...]}, a pasted table in the
+    "table" form field or an uploaded CSV in "file". Submissions may also be identified by
+    student_id (as in the grades.csv of the submissions ZIP). Valid rows are written with one
+    executemany; the response lists what was applied and why any row was skipped.
+    """
+    assignment = Assignment.query.get_or_404(assignment_id)
+
+    if request.is_json:
+        rows = (request.get_json(silent=True) or {}).get('grades') or []
+    elif request.files.get('file'):
+        rows = _parse_grade_rows(request.files['file'].read().decode('utf-8-sig', errors='replace'))
+    else:
+        rows = _parse_grade_rows(request.form.get('table', ''))
+    if not isinstance(rows, list) or len(rows) > BULK_GRADE_LIMIT:
+        return {'error': f'Expected a list of at most {BULK_GRADE_LIMIT} grades'}, 400
+
+    # One query for every submission of the assignment, keyed both ways
+    existing = db.session.execute(
+        db.select(Submission.id, Submission.user_id, Submission.grade, Submission.feedback)
+        .where(Submission.assignment_id == assignment.id)
+    ).all()
+    by_id = {s.id: s for s in existing}
+    by_student = {s.user_id: s for s in existing}
+
+    updates = {}
+    errors = []
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'error': 'Row must be an object'})
+            continue
+        try:
+            if str(row.get('submission_id') or '').strip():
+                submission = by_id.get(int(row['submission_id']))
+            else:
+                submission = by_student.get(int(row.get('student_id')))
+        except (TypeError, ValueError):
+            errors.append({'row': number, 'error': 'Missing or invalid submission_id'})
+            continue
+        if submission is None:
+            errors.append({'row': number, 'error': 'No such submission for this assignment'})
+            continue
+
+        grade = str(row.get('grade') if row.get('grade') is not None else '').strip()
+        if not grade:
+            continue # Blank grade cells are left as they are
+        try:
+            grade = int(grade)
+        except ValueError:
+            errors.append({'row': number, 'error': f"Grade '{grade}' is not a whole number"})
+            continue
+        if not 0 <= grade <= assignment.max_score:
+            errors.append({'row': number, 'error': f'Grade must be between 0 and {assignment.max_score}'})
+            continue
+
+        feedback = row.get('feedback')
+        updates[submission.id] = {
+            'id': submission.id,
+            'grade': grade,
+            'feedback': submission.feedback if feedback is None else (str(feedback).strip() or None),
+            'user_id': submission.user_id,
+            'old_grade': submission.grade,
+        }
+
+    if updates:
+        # ORM bulk UPDATE by primary key: a single executemany statement
+        db.session.execute(db.update(Submission),
+                           [{k: u[k] for k in ('id', 'grade', 'feedback')} for u in updates.values()])
+        course_id = assignment.lesson.module.course_id
+        record_grade_changes(course_id, [(u['user_id'], u['old_grade'], u['grade']) for u in updates.values()])
+        # The flush hooks only see objects, so bump the cache versions ourselves
+        bump_version(f'course:{course_id}:submissions', *{f"progress:{u['user_id']}" for u in updates.values()})
+        db.session.commit()
+
+    return {
+        'updated': len(updates),
+        'skipped': len(rows) - len(updates) - len(errors),
+        'errors': errors,
+        'grades': [{'submission_id': u['id'], 'grade': u['grade']} for u in updates.values()],
+    }
+
+
+# --- Profiles ---
+from app.profiling import list_profiles, profile_path, top_frames
+from flask import abort
+
+@admin_bp.route('/profiles')
+def profiles():
+    grouped = list_profiles()
+    # Routes with the slowest captured request first
+    routes = sorted(grouped.items(), key=lambda item: item[1][0]['duration_ms'], reverse=True)
+    return render_template('admin/profiles.html', routes=routes)
+
+@admin_bp.route('/profiles/<route>/<name>')
+def view_profile(route, name):
+    path = profile_path(route, name)
+    if path is None:
+        abort(404)
+    if request.args.get('download'):
+        return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+    total, frames = top_frames(path)
+    return render_template('admin/profile_detail.html', endpoint=route, name=name, total=total, frames=frames)
+
+
+# --- Analytics ---
+from datetime import timedelta
+from app.models import DailyCourseStats, DailySignupStats
+
+ANALYTICS_RANGES = (7, 30, 90, 365)
+ANALYTICS_METRICS = ('active_students', 'lessons_completed', 'quiz_attempts', 'quizzes_passed', 'submissions')
+
+@admin_bp.route('/analytics')
+def analytics():
+    """Engagement charts, read from the daily rollups only (at most days x courses rows)."""
+    days = request.args.get('days', 30, type=int)
+    if days not in ANALYTICS_RANGES:
+        days = 30
+    course_id = request.args.get('course', type=int)
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    query = DailyCourseStats.query.filter(DailyCourseStats.day >= since)
+    if course_id:
+        query = query.filter_by(course_id=course_id)
+    series = {since + timedelta(days=i): dict.fromkeys(ANALYTICS_METRICS, 0) for i in range(days)}
+    by_course = {}
+    for row in query:
+        totals = by_course.setdefault(row.course_id, dict.fromkeys(ANALYTICS_METRICS, 0))
+        for name in ANALYTICS_METRICS:
+            series[row.day][name] += getattr(row, name)
+            totals[name] += getattr(row, name)
+    for day, values in series.items():
+        values['day'] = day
+
+    signups = {since + timedelta(days=i): {'day': since + timedelta(days=i), 'registrations': 0, 'approvals': 0}
+               for i in range(days)}
+    for row in DailySignupStats.query.filter(DailySignupStats.day >= since):
+        signups[row.day].update(registrations=row.registrations, approvals=row.approvals)
+
+    courses = Course.query.order_by(Course.title).all()
+    last_day = db.session.execute(db.select(db.func.max(DailyCourseStats.day))).scalar()
+    return render_template('admin/analytics.html', days=days, ranges=ANALYTICS_RANGES, course_id=course_id,
+                           series=list(series.values()), signups=list(signups.values()), courses=courses,
+                           by_course=by_course, last_day=last_day)
+
+@admin_bp.route('/analytics/refresh', methods=['POST'])
+def refresh_analytics():
+    enqueue('rollup_daily_stats')
+    db.session.commit()
+    flash('The daily rollups are being updated.', 'success')
+    return redirect(url_for('admin_bp.analytics', **request.args))
+
 @admin_bp.route('/student/<int:user_id>/change_password', methods=['POST'])
 @login_required
 def change_student_password(user_id):
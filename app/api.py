@@ -0,0 +1,286 @@
+import base64
+import json
+
+from flask import Blueprint, request, abort, jsonify
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from app.models import Course, Quiz, Assignment, Submission, QuizResult
+from app.queries import (enrolled_course_ids, outline_options, completed_lesson_ids, latest_quiz_results,
+                         user_submissions, course_progress, course_items)
+from app.resume import resume_lessons
+from app.versions import conditional, enrolled_course_keys
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Fields each resource type can return; fields=a,b (primary type) or fields[type]=a,b picks a subset
+FIELDS = {
+    'course': ['id', 'title', 'description', 'thumbnail_url', 'category_id', 'created_at'],
+    'module': ['id', 'title', 'order_index', 'course_id'],
+    'lesson': ['id', 'title', 'order_index', 'module_id', 'video_url', 'content'],
+    'quiz': ['id', 'title', 'lesson_id', 'course_id', 'created_at'],
+    'assignment': ['id', 'lesson_id', 'course_id', 'instructions', 'max_score', 'has_resource', 'created_at'],
+    'submission': ['id', 'assignment_id', 'submitted_at', 'grade', 'feedback', 'status'],
+    'quiz_result': ['id', 'quiz_id', 'score', 'passed', 'attempted_at'],
+    'progress': ['course_id', 'completed', 'total', 'percent', 'resume_lesson_id'],
+}
+
+
+# --- Errors and auth ---
+
+@api_bp.before_request
+def require_student_session():
+    # The API shares the web login session; answer with JSON instead of the login redirect
+    if not current_user.is_authenticated:
+        return jsonify(error='Authentication required'), 401
+    if current_user.status != 'approved' and current_user.role != 'admin':
+        return jsonify(error='Account not approved'), 403
+
+
+@api_bp.errorhandler(HTTPException)
+def json_error(e):
+    return jsonify(error=e.description), e.code
+
+
+# --- Request helpers ---
+
+def _requested_fields(type_name, primary):
+    raw = request.args.get(f'fields[{type_name}]')
+    if raw is None and primary:
+        raw = request.args.get('fields')
+    if raw is None:
+        return None
+    fields = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = fields - set(FIELDS[type_name])
+    if unknown:
+        abort(400, f"Unknown {type_name} field(s): {', '.join(sorted(unknown))}")
+    return fields | {'id'} if 'id' in FIELDS[type_name] else fields
+
+
+def _includes(allowed):
+    """Validated include= paths; 'a.b' implies 'a'."""
+    requested = {p.strip() for p in request.args.get('include', '').split(',') if p.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        abort(400, f"Unknown include(s): {', '.join(sorted(unknown))}; allowed: {', '.join(allowed)}")
+    for path in list(requested):
+        parts = path.split('.')
+        requested.update('.'.join(parts[:i]) for i in range(1, len(parts)))
+    return requested
+
+
+def _render(type_name, values, primary=False):
+    """Serialize one resource through its sparse fieldset; nested keys (lists/dicts) pass through."""
+    fields = _requested_fields(type_name, primary)
+    data = {}
+    for key, value in values.items():
+        if key in FIELDS[type_name] and fields is not None and key not in fields:
+            continue
+        data[key] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return data
+
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json.dumps({'after': last_id}).encode()).decode().rstrip('=')
+
+
+def _decode_cursor():
+    raw = request.args.get('cursor')
+    if not raw:
+        return 0
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4)))['after'])
+    except (ValueError, KeyError, TypeError):
+        abort(400, 'Invalid cursor')
+
+
+def _paginate(query, id_column):
+    """Keyset page of query ordered by id_column: (rows, next_cursor). Rows may be tuples."""
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+    rows = query.filter(id_column > _decode_cursor()).order_by(id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0] if hasattr(rows[-1], '_fields') else rows[-1]
+        next_cursor = _encode_cursor(last.id)
+    return rows, next_cursor
+
+
+def _page(data, next_cursor):
+    return jsonify(data=data, next_cursor=next_cursor)
+
+
+# --- Serializers ---
+
+def _course_json(course, includes, completed=None, progress=None, resume=None, primary=True):
+    data = {
+        'id': course.id, 'title': course.title, 'description': course.description,
+        'thumbnail_url': course.thumbnail_url, 'category_id': course.category_id, 'created_at': course.created_at,
+    }
+    if 'modules' in includes:
+        data['modules'] = [_module_json(m, includes, completed) for m in course.modules]
+    if progress is not None:
+        data['progress'] = _progress_json(course.id, *progress.get(course.id, (0, 0)), resume=resume)
+    return _render('course', data, primary)
+
+
+def _module_json(module, includes, completed):
+    data = {'id': module.id, 'title': module.title, 'order_index': module.order_index, 'course_id': module.course_id}
+    if 'modules.lessons' in includes:
+        data['lessons'] = [_lesson_json(l, includes, completed, module.course_id) for l in module.lessons]
+    return _render('module', data)
+
+
+def _lesson_json(lesson, includes, completed, course_id):
+    data = {
+        'id': lesson.id, 'title': lesson.title, 'order_index': lesson.order_index, 'module_id': lesson.module_id,
+        'video_url': lesson.video_url, 'content': lesson.content,
+    }
+    if completed is not None:
+        data['completed'] = lesson.id in completed
+    if 'modules.lessons.quiz' in includes:
+        data['quiz'] = _quiz_json(lesson.quiz, course_id) if lesson.quiz else None
+    if 'modules.lessons.assignment' in includes:
+        data['assignment'] = _assignment_json(lesson.assignment, course_id) if lesson.assignment else None
+    return _render('lesson', data)
+
+
+def _quiz_json(quiz, course_id, result=None, with_result=False, primary=False):
+    data = {'id': quiz.id, 'title': quiz.title, 'lesson_id': quiz.lesson_id, 'course_id': course_id,
+            'created_at': quiz.created_at}
+    if with_result:
+        data['latest_result'] = _quiz_result_json(result) if result else None
+    return _render('quiz', data, primary)
+
+
+def _quiz_result_json(result, primary=False):
+    return _render('quiz_result', {'id': result.id, 'quiz_id': result.quiz_id, 'score': result.score,
+                                   'passed': result.passed, 'attempted_at': result.attempted_at}, primary)
+
+
+def _assignment_json(assignment, course_id, submission=None, with_submission=False, primary=False):
+    data = {
+        'id': assignment.id, 'lesson_id': assignment.lesson_id, 'course_id': course_id,
+        'instructions': assignment.instructions, 'max_score': assignment.max_score,
+        'has_resource': bool(assignment.resource_path), 'created_at': assignment.created_at,
+    }
+    if with_submission:
+        data['submission'] = _submission_json(submission) if submission else None
+    return _render('assignment', data, primary)
+
+
+def _submission_json(submission, primary=False):
+    return _render('submission', {
+        'id': submission.id, 'assignment_id': submission.assignment_id, 'submitted_at': submission.submitted_at,
+        'grade': submission.grade, 'feedback': submission.feedback,
+        'status': 'graded' if submission.grade is not None else 'submitted',
+    }, primary)
+
+
+def _progress_json(course_id, completed, total, resume=None, primary=False):
+    return _render('progress', {'course_id': course_id, 'completed': completed, 'total': total,
+                                'percent': int(completed / total * 100) if total else 0,
+                                'resume_lesson_id': (resume or {}).get(course_id)}, primary)
+
+
+def _student_keys():
+    return enrolled_course_keys(current_user.id) + [f'progress:{current_user.id}', f'resume:{current_user.id}']
+
+
+# --- Endpoints ---
+
+COURSE_INCLUDES = ['modules', 'modules.lessons', 'modules.lessons.quiz', 'modules.lessons.assignment', 'progress']
+
+
+def _course_options(includes):
+    if 'modules.lessons' in includes:
+        return outline_options(lessons=True)
+    if 'modules' in includes:
+        return outline_options(lessons=False)
+    return []
+
+
+@api_bp.route('/courses')
+@conditional(lambda: _student_keys())
+def courses():
+    """Enrolled courses. include=modules[.lessons[.quiz|.assignment]],progress"""
+    includes = _includes(COURSE_INCLUDES)
+    course_ids = enrolled_course_ids(current_user.id)
+    query = Course.query.options(*_course_options(includes)).filter(Course.id.in_(course_ids))
+    page, next_cursor = _paginate(query, Course.id)
+
+    page_ids = [c.id for c in page]
+    progress = course_progress(current_user.id, page_ids) if 'progress' in includes and page_ids else None
+    resume = resume_lessons(current_user.id, page_ids) if progress is not None else None
+    completed = completed_lesson_ids(current_user.id) if 'modules.lessons' in includes else None
+    return _page([_course_json(c, includes, completed, progress, resume) for c in page], next_cursor)
+
+
+@api_bp.route('/courses/<int:course_id>')
+@conditional(lambda course_id: [f'course:{course_id}', f'progress:{current_user.id}', f'resume:{current_user.id}'])
+def course_outline(course_id):
+    """One course with its full outline (modules and lessons) and the student's completion flags."""
+    if course_id not in enrolled_course_ids(current_user.id):
+        abort(404, 'Course not found')
+    includes = _includes(COURSE_INCLUDES) | {'modules', 'modules.lessons'}
+    course = Course.query.options(*_course_options(includes)).filter_by(id=course_id).first_or_404()
+    lesson_ids = [l.id for m in course.modules for l in m.lessons]
+    completed = completed_lesson_ids(current_user.id, lesson_ids)
+    progress = course_progress(current_user.id, [course.id]) if 'progress' in includes else None
+    resume = resume_lessons(current_user.id, [course.id]) if progress is not None else None
+    return jsonify(data=_course_json(course, includes, completed, progress, resume))
+
+
+@api_bp.route('/progress')
+@conditional(lambda: _student_keys())
+def progress():
+    """Completed and total lessons per enrolled course, and the lesson to continue from."""
+    course_ids = enrolled_course_ids(current_user.id)
+    counts = course_progress(current_user.id, course_ids) if course_ids else {}
+    resume = resume_lessons(current_user.id, course_ids) if course_ids else {}
+    return jsonify(data=[_progress_json(cid, *counts[cid], resume=resume, primary=True) for cid in course_ids])
+
+
+@api_bp.route('/quizzes')
+@conditional(lambda: _student_keys())
+def quizzes():
+    """Quizzes in enrolled courses. include=latest_result"""
+    includes = _includes(['latest_result'])
+    query = course_items(Quiz, enrolled_course_ids(current_user.id))
+    page, next_cursor = _paginate(query, Quiz.id)
+    results = latest_quiz_results(current_user.id, [q.id for q, _ in page]) if 'latest_result' in includes else {}
+    return _page([_quiz_json(q, course_id, results.get(q.id), 'latest_result' in includes, primary=True)
+                  for q, course_id in page], next_cursor)
+
+
+@api_bp.route('/assignments')
+@conditional(lambda: _student_keys())
+def assignments():
+    """Assignments in enrolled courses. include=submission"""
+    includes = _includes(['submission'])
+    query = course_items(Assignment, enrolled_course_ids(current_user.id))
+    page, next_cursor = _paginate(query, Assignment.id)
+    submissions = user_submissions(current_user.id, [a.id for a, _ in page]) if 'submission' in includes else {}
+    return _page([_assignment_json(a, course_id, submissions.get(a.id), 'submission' in includes, primary=True)
+                  for a, course_id in page], next_cursor)
+
+
+@api_bp.route('/submissions')
+@conditional(lambda: [f'progress:{current_user.id}'])
+def submissions():
+    """The student's own submissions, oldest first."""
+    query = Submission.query.filter_by(user_id=current_user.id)
+    page, next_cursor = _paginate(query, Submission.id)
+    return _page([_submission_json(s, primary=True) for s in page], next_cursor)
+
+
+@api_bp.route('/quiz-results')
+@conditional(lambda: [f'progress:{current_user.id}'])
+def quiz_results():
+    """The student's quiz attempts kept by the retention policy (app.quiz_archive), oldest first."""
+    query = QuizResult.query.filter_by(user_id=current_user.id)
+    page, next_cursor = _paginate(query, QuizResult.id)
+    return _page([_quiz_result_json(r, primary=True) for r in page], next_cursor)
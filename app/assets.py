@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import json
+import os
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError: # .br variants are skipped without it; gzip is always emitted
+    brotli = None
+
+# Logical bundle name -> source files under app/static, concatenated in order
+ASSET_BUNDLES = {
+    'app.css': ['css/style.css', 'css/profile-modal.css'],
+    'landing.css': ['css/landing.css'],
+}
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+assets_bp = Blueprint('assets', __name__)
+
+_manifest = None
+
+
+def dist_folder():
+    return os.path.join(current_app.static_folder, DIST_DIR)
+
+
+def build_assets():
+    """Concatenate each bundle, write it under a content-hashed name plus .gz/.br variants, and the manifest."""
+    out_dir = dist_folder()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+
+    for name, sources in ASSET_BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(current_app.static_folder, source), 'rb') as f:
+                parts.append(f.read().rstrip(b'\n') + b'\n')
+        data = b'\n'.join(parts)
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        filename = f"{stem}.{digest}{ext}"
+        path = os.path.join(out_dir, filename)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+        manifest[name] = filename
+
+    # Written last so a half-finished build is never picked up
+    tmp = os.path.join(out_dir, MANIFEST + '.part')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def load_manifest():
+    global _manifest
+    if _manifest is None or current_app.debug:
+        try:
+            with open(os.path.join(dist_folder(), MANIFEST)) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def asset_urls(name):
+    """URLs to link for a bundle: the fingerprinted file after a build, otherwise its sources."""
+    filename = load_manifest().get(name)
+    if filename:
+        return [url_for('assets.dist_asset', filename=filename)]
+    return [url_for('static', filename=source) for source in ASSET_BUNDLES[name]]
+
+
+@assets_bp.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+    # Fingerprinted names never change content, so they can be cached forever
+    if filename not in load_manifest().values():
+        abort(404)
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    response = None
+    for suffix, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+        if encoding in accepted and os.path.exists(os.path.join(dist_folder(), filename + suffix)):
+            response = send_from_directory(dist_folder(), filename + suffix, mimetype=_mimetype(filename))
+            response.headers['Content-Encoding'] = encoding
+            response.headers.pop('Content-Disposition', None)
+            break
+    if response is None:
+        response = send_from_directory(dist_folder(), filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _mimetype(filename):
+    return 'text/css' if filename.endswith('.css') else 'application/javascript'
+
+
+def immutable_upload_headers(response):
+    # Content-addressed uploads and their derivatives never change under the same URL
+    if request.endpoint == 'static' and response.status_code == 200:
+        filename = (request.view_args or {}).get('filename', '')
+        if filename.startswith(('uploads/blobs/', 'uploads/derived/blobs/')):
+            response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Bundle, fingerprint and precompress static CSS."""
+    manifest = build_assets()
+    for name, filename in sorted(manifest.items()):
+        click.echo(f"{name} -> {DIST_DIR}/{filename}")
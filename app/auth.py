@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from app import db, bcrypt
+from app import db, bcrypt, activity
 from app.models import User
 
 auth = Blueprint('auth', __name__)
@@ -29,6 +29,7 @@ def login():
                     return redirect(url_for('auth.login'))
             
             login_user(user)
+            activity.log_event(activity.LOGIN, user_id=user.id)
             if user.role == 'admin':
                 return redirect(url_for('main.dashboard'))
             else:
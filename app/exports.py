@@ -0,0 +1,154 @@
+import csv
+import io
+import os
+import zipfile
+from xml.sax.saxutils import escape
+
+# Formats that are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.zip', '.docx', '.xlsx', '.pptx'}
+CHUNK_SIZE = 64 * 1024
+
+
+class _ZipStream:
+    """Write-only sink for ZipFile that hands back whatever was written since the last drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """Yield a ZIP archive built on the fly, without a temp file.
+
+    entries is an iterable of (arcname, source, date_time) where source is a path on disk
+    (read in chunks), bytes, or an iterable of bytes chunks. Memory use stays at one chunk
+    plus the central directory.
+    """
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for arcname, source, date_time in entries:
+            zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+            ext = os.path.splitext(arcname)[1].lower()
+            zinfo.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+            if isinstance(source, bytes):
+                zinfo.file_size = len(source)
+                with zf.open(zinfo, 'w') as dest:
+                    dest.write(source)
+            elif isinstance(source, str):
+                zinfo.file_size = os.path.getsize(source) # Lets zipfile pick zip64 up front for huge files
+                with open(source, 'rb') as src, zf.open(zinfo, 'w') as dest:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        dest.write(chunk)
+                        yield sink.drain()
+            else:
+                with zf.open(zinfo, 'w') as dest:
+                    for chunk in source:
+                        dest.write(chunk)
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def csv_bytes(header, rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return out.getvalue().encode('utf-8')
+
+
+def stream_csv(header, rows):
+    """Yield CSV text a row batch at a time from an iterable of rows."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % 200 == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+# --- Minimal streaming XLSX (one sheet, inline strings) ---
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_sheet(header, rows):
+    yield ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>').encode()
+    batch = []
+    if header:
+        batch.append('<row>' + ''.join(_xlsx_cell(v) for v in header) + '</row>')
+    for row in rows:
+        batch.append('<row>' + ''.join(_xlsx_cell(v) for v in row) + '</row>')
+        if len(batch) >= 200:
+            yield ''.join(batch).encode()
+            batch = []
+    batch.append('</sheetData></worksheet>')
+    yield ''.join(batch).encode()
+
+
+def stream_xlsx(header, rows, sheet_name='Sheet1', date_time=(1980, 1, 1, 0, 0, 0)):
+    """Yield a single-sheet .xlsx workbook, writing rows as they come from the iterable."""
+    name = escape(sheet_name[:31], {'"': '&quot;'})
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )
+    entries = [(name, body.encode(), date_time) for name, body in _XLSX_STATIC.items()]
+    entries.append(('xl/workbook.xml', workbook.encode(), date_time))
+    entries.append(('xl/worksheets/sheet1.xml', _xlsx_sheet(header, rows), date_time))
+    return stream_zip(entries)
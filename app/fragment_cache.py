@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class NullCache:
+    """Renders every fragment (used to switch caching off)."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+
+class LRUCache:
+    """In-process cache holding the most recently used fragments."""
+
+    def __init__(self, maxsize=500):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class SQLiteCache:
+    """Cache shared by every worker process on the host, stored in a local SQLite file."""
+
+    def __init__(self, path, maxsize=5000):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fragment '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, used REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value, expires FROM fragment WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key, value, timeout=None):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO fragment (key, value, expires, used) VALUES (?, ?, ?, ?)',
+            (key, value, now + timeout if timeout else None, now),
+        )
+        # Trim occasionally instead of on every write
+        if hash(key) % 50 == 0:
+            conn.execute(
+                'DELETE FROM fragment WHERE key IN '
+                '(SELECT key FROM fragment ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                (self.maxsize,),
+            )
+
+
+def make_cache(app):
+    backend = app.config.get('FRAGMENT_CACHE', 'lru')
+    if backend == 'sqlite':
+        return SQLiteCache(os.path.join(app.instance_path, 'fragment_cache.db'),
+                           maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 5000))
+    if backend == 'lru':
+        return LRUCache(maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 500))
+    return NullCache()
+
+
+def _key_part(value):
+    if isinstance(value, (list, tuple)):
+        return ':'.join(_key_part(v) for v in value)
+    return str(value)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, version[, timeout] %}...{% endcache %}
+
+    key and version may be lists; a fragment is rendered once per (key, version) and
+    served from environment.fragment_cache until the version changes.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=NullCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        parser.stream.expect('comma')
+        args.append(parser.parse_expression())
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, version, timeout, caller):
+        cache_key = f"fragment:{_key_part(key)}@{_key_part(version)}"
+        cache = self.environment.fragment_cache
+        value = cache.get(cache_key)
+        if value is None:
+            value = caller()
+            cache.set(cache_key, str(value), timeout)
+        return Markup(value)
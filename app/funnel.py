@@ -0,0 +1,92 @@
+import json
+import warnings
+
+from flask import current_app
+
+from app import db
+from app.models import Lesson, Module, LessonProgress, enrollments
+from app.versions import data_version
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional; the funnel tab says so instead of rendering
+    np = None
+
+# Lesson funnel of a course: for each lesson in course order, how many enrolled students
+# completed it, the drop-off from the lesson before, and the median time between completing
+# the previous lesson and this one. Built from three queries (lessons, enrollments, completions)
+# as a students x lessons matrix, and cached per course until its structure, its lesson
+# progress or the enrollments change.
+
+
+def compute_funnel(course_id):
+    lessons = db.session.execute(
+        db.select(Lesson.id, Lesson.title, Module.title).join(Module, Module.id == Lesson.module_id)
+        .where(Module.course_id == course_id).order_by(Module.order_index, Lesson.order_index, Lesson.id)
+    ).all()
+    students = np.array(db.session.execute(
+        db.select(enrollments.c.user_id).where(enrollments.c.course_id == course_id).order_by(enrollments.c.user_id)
+    ).scalars().all(), dtype=np.int64)
+    completions = db.session.execute(
+        db.select(LessonProgress.user_id, LessonProgress.lesson_id, LessonProgress.completed_at)
+        .join(Lesson, Lesson.id == LessonProgress.lesson_id).join(Module, Module.id == Lesson.module_id)
+        .where(Module.course_id == course_id, LessonProgress.is_completed == True)
+    ).all()
+
+    position = {lesson_id: i for i, (lesson_id, _, _) in enumerate(lessons)}
+    # Completed flag and completion time (NaN if unknown) per (student, lesson)
+    done = np.zeros((len(students), len(lessons)), dtype=bool)
+    times = np.full(done.shape, np.nan)
+    if completions and len(students):
+        user_ids = np.array([c[0] for c in completions], dtype=np.int64)
+        rows = np.minimum(np.searchsorted(students, user_ids), len(students) - 1)
+        enrolled = students[rows] == user_ids # Progress of students who have left the course is ignored
+        cols = np.array([position[c[1]] for c in completions])
+        stamps = np.array([c[2].timestamp() if c[2] else np.nan for c in completions])
+        done[rows[enrolled], cols[enrolled]] = True
+        times[rows[enrolled], cols[enrolled]] = stamps[enrolled]
+
+    completed = done.sum(axis=0)
+    # Drop-off is measured against the lesson before (the first lesson against everyone enrolled)
+    previous = np.concatenate(([len(students)], completed[:-1]))[:len(lessons)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = completed / len(students) if len(students) else np.zeros(len(lessons))
+        dropoff = np.where(previous > 0, 1 - completed / previous, 0.0)
+
+    # Hours from completing lesson i-1 to completing lesson i, for students who did both in that order
+    gaps = np.full(times.shape, np.nan)
+    if len(lessons) > 1:
+        gaps[:, 1:] = (times[:, 1:] - times[:, :-1]) / 3600
+        gaps[gaps < 0] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # All-NaN columns have no median
+        median = np.nanmedian(gaps, axis=0) if len(students) else np.full(len(lessons), np.nan)
+
+    return {
+        'students': int(len(students)),
+        'lessons': [{
+            'position': i + 1,
+            'lesson_id': lesson_id,
+            'title': title,
+            'module': module_title,
+            'completed': int(completed[i]),
+            'rate': float(rate[i]),
+            'dropoff': float(dropoff[i]),
+            'median_hours': None if np.isnan(median[i]) else round(float(median[i]), 1),
+        } for i, (lesson_id, title, module_title) in enumerate(lessons)],
+    }
+
+
+def course_funnel(course_id):
+    """The funnel of a course (see compute_funnel), or None without NumPy."""
+    if np is None:
+        return None
+    version = data_version(f'course:{course_id}', f'course:{course_id}:progress', 'students')
+    cache = current_app.jinja_env.fragment_cache
+    key = f'funnel:{course_id}@{version}'
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    funnel = compute_funnel(course_id)
+    cache.set(key, json.dumps(funnel))
+    return funnel
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow is optional; pages keep serving the originals without it
+    Image = None
+
+# Resized, recompressed copies of avatars and course thumbnails are written to
+# derived/<upload path without extension>_<width>.<webp|jpg>, with a small JSON
+# manifest written last so that any worker can tell when a set is complete.
+DERIVED_DIR = 'derived'
+DERIVATIVE_WIDTHS = (160, 320, 640)
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_lock = threading.Lock()
+_in_flight = set()
+_failed = set()
+_manifests = {} # path -> list of widths, only for completed sets
+
+
+def is_image(path):
+    return bool(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _stem(path):
+    return f"{DERIVED_DIR}/{os.path.splitext(path)[0]}"
+
+
+def manifest_path(path):
+    return f"{_stem(path)}.json"
+
+
+def derivative_path(path, width, fmt):
+    return f"{_stem(path)}_{width}.{fmt}"
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = current_app.config.get('IMAGE_WORKERS', 2)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-derivatives')
+        return _executor
+
+
+def _write_atomic(image, dest, pil_format, options):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.part"
+    image.save(tmp, pil_format, **options)
+    os.replace(tmp, dest)
+
+
+def build_derivatives(upload_root, path):
+    """Write every derivative for one upload, then its manifest. Returns the widths produced."""
+    with Image.open(os.path.join(upload_root, path)) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+        # Never upscale; images narrower than the smallest width get one recompressed copy
+        widths = [w for w in DERIVATIVE_WIDTHS if w < source.width] or [source.width]
+        for width in widths:
+            height = max(1, round(source.height * width / source.width))
+            resized = source.resize((width, height), Image.LANCZOS)
+            for fmt, (pil_format, options) in FORMATS.items():
+                image = resized.convert('RGB') if pil_format == 'JPEG' else resized
+                _write_atomic(image, os.path.join(upload_root, derivative_path(path, width, fmt)), pil_format, options)
+
+    dest = os.path.join(upload_root, manifest_path(path))
+    with open(f"{dest}.part", 'w') as f:
+        json.dump({'widths': widths}, f)
+    os.replace(f"{dest}.part", dest)
+    return widths
+
+
+def _run(app, upload_root, path):
+    try:
+        _manifests[path] = build_derivatives(upload_root, path)
+    except Exception:
+        _failed.add(path)
+        app.logger.exception('Could not build image derivatives for %s', path)
+    finally:
+        _in_flight.discard(path)
+
+
+def schedule_derivatives(path):
+    """Queue derivative generation for an uploaded image on the background pool."""
+    if Image is None or not is_image(path) or path.startswith('http'):
+        return
+    with _lock:
+        if path in _in_flight or path in _failed or path in _manifests:
+            return
+        _in_flight.add(path)
+    app = current_app._get_current_object()
+    _get_executor().submit(_run, app, app.config['UPLOAD_FOLDER'], path)
+
+
+def derivative_widths(path):
+    """Widths of a completed derivative set, or None if it is not ready yet."""
+    if path in _manifests:
+        return _manifests[path]
+    try:
+        with open(os.path.join(current_app.config['UPLOAD_FOLDER'], manifest_path(path))) as f:
+            widths = json.load(f)['widths']
+    except (OSError, ValueError, KeyError):
+        return None
+    _manifests[path] = widths
+    return widths
+
+
+def derivative_files(upload_root, path):
+    """Every file belonging to the derivative set of an upload (used by the upload GC)."""
+    try:
+        with open(os.path.join(upload_root, manifest_path(path))) as f:
+            widths = json.load(f)['widths']
+    except (OSError, ValueError, KeyError):
+        return []
+    files = [manifest_path(path)]
+    for width in widths:
+        files.extend(derivative_path(path, width, fmt) for fmt in FORMATS)
+    return files
+
+
+def image_srcset(path, fmt='webp'):
+    """srcset for an uploaded image, or '' so the template falls back to the original.
+
+    A missing set is queued for generation, which also covers images uploaded before the pipeline existed.
+    """
+    if not is_image(path) or path.startswith('http'):
+        return ''
+    widths = derivative_widths(path)
+    if widths is None:
+        schedule_derivatives(path)
+        return ''
+    return ', '.join(
+        f"{url_for('static', filename='uploads/' + derivative_path(path, w, fmt))} {w}w" for w in widths
+    )
@@ -0,0 +1,224 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, current_app, request, abort, has_request_context
+from flask.cli import with_appcontext
+from flask_login import login_required, current_user
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models import Job
+
+# Registered job handlers: name -> (function, per-name concurrency limit or None)
+_registry = {}
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+RETRY_BASE_SECONDS = 10
+HEARTBEAT_SECONDS = 15 # A running job renews its lease this often; workers look for expired leases as often
+LEASE = timedelta(seconds=60) # A running job whose lease wasn't renewed for this long belongs to a dead worker
+
+
+def job(name, concurrency=None):
+    """Register a function as a background job. Keyword arguments must be JSON-serialisable."""
+    def decorator(fn):
+        _registry[name] = (fn, concurrency)
+        return fn
+    return decorator
+
+
+def enqueue(name, max_attempts=3, delay=0, **payload):
+    """Queue a job in the current transaction; it becomes visible to workers when the request commits."""
+    if name not in _registry:
+        raise KeyError(f"Unknown job '{name}'")
+    user_id = current_user.id if has_request_context() and current_user.is_authenticated else None
+    new_job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        user_id=user_id,
+    )
+    db.session.add(new_job)
+    return new_job
+
+
+# --- Worker ---
+
+def _requeue_stale():
+    db.session.execute(
+        db.update(Job)
+        .where(Job.status == 'running', Job.locked_at < datetime.utcnow() - LEASE)
+        .values(status='queued', locked_by=None, locked_at=None)
+    )
+    db.session.commit()
+
+
+def _claim(worker_id):
+    """Atomically mark the next runnable job as ours and return its id (or None).
+
+    Per-name concurrency limits are checked by the UPDATE itself, so two workers can't both
+    take the last free slot.
+    """
+    now = datetime.utcnow()
+    queued = db.aliased(Job)
+    runnable = [queued.status == 'queued', queued.run_at <= now]
+    limited = {name: limit for name, (_, limit) in _registry.items() if limit}
+    if limited:
+        running = db.aliased(Job)
+        limit = db.case(limited, value=queued.name)
+        running_count = (db.select(db.func.count(running.id))
+                         .where(running.status == 'running', running.name == queued.name).scalar_subquery())
+        runnable.append(db.or_(limit.is_(None), running_count < limit))
+    next_id = (
+        db.select(queued.id)
+        .where(*runnable)
+        .order_by(queued.run_at, queued.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    job_id = db.session.execute(
+        db.update(Job)
+        .where(Job.id == next_id, Job.status == 'queued')
+        .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id)
+    ).scalar()
+    db.session.commit()
+    return job_id
+
+
+def _renew_lease(app, job_id, worker_id, done):
+    """Keep a running job's lease fresh until done is set (own connection, outside the job's transaction)."""
+    with app.app_context():
+        while not done.wait(HEARTBEAT_SECONDS):
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        db.update(Job.__table__)
+                        .where(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id)
+                        .values(locked_at=datetime.utcnow())
+                    )
+            except SQLAlchemyError:
+                app.logger.warning('Could not renew the lease of job %s', job_id, exc_info=True)
+
+
+def run_job(job_id):
+    """Run one claimed job, recording its result or scheduling a retry."""
+    claimed = db.session.get(Job, job_id)
+    fn, _ = _registry.get(claimed.name, (None, None))
+    done = threading.Event()
+    threading.Thread(target=_renew_lease, args=(current_app._get_current_object(), job_id, claimed.locked_by, done),
+                     name=f'job-lease-{job_id}', daemon=True).start()
+    try:
+        return _run_claimed(claimed, fn)
+    finally:
+        done.set()
+
+
+def _run_claimed(claimed, fn):
+    job_id = claimed.id
+    try:
+        if fn is None:
+            raise KeyError(f"Unknown job '{claimed.name}'")
+        result = fn(**json.loads(claimed.payload))
+        # The handler's writes and the job's completion commit together
+        claimed.status = 'done'
+        claimed.result = json.dumps(result) if result is not None else None
+        claimed.last_error = None
+        claimed.finished_at = datetime.utcnow()
+        claimed.locked_by = None
+        claimed.locked_at = None
+        db.session.commit()
+        return
+    except Exception:
+        db.session.rollback()
+        claimed = db.session.get(Job, job_id)
+        claimed.last_error = traceback.format_exc(limit=5)
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = 'queued'
+            claimed.run_at = datetime.utcnow() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (claimed.attempts - 1))
+        else:
+            claimed.status = 'failed'
+            claimed.finished_at = datetime.utcnow()
+    claimed.locked_by = None
+    claimed.locked_at = None
+    db.session.commit()
+
+
+def run_worker(app, concurrency=2, poll_interval=1.0, stop_event=None):
+    """Claim and run jobs on `concurrency` threads until stop_event is set, then finish in-flight jobs."""
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    next_sweep = [0.0] # Shared by the slots: expired leases are looked for every HEARTBEAT_SECONDS
+
+    def loop(slot):
+        with app.app_context():
+            while not stop_event.is_set():
+                if time.monotonic() >= next_sweep[0]:
+                    next_sweep[0] = time.monotonic() + HEARTBEAT_SECONDS
+                    _requeue_stale()
+                job_id = _claim(f"{worker_id}:{slot}")
+                if job_id is None:
+                    db.session.remove()
+                    stop_event.wait(poll_interval)
+                    continue
+                run_job(job_id)
+
+    threads = [threading.Thread(target=loop, args=(i,), name=f'job-worker-{i}') for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+@click.command('jobs-worker')
+@click.option('--concurrency', default=2, show_default=True, help='Jobs run at the same time by this process.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@with_appcontext
+def jobs_worker_command(concurrency, poll_interval):
+    """Run queued background jobs until SIGINT/SIGTERM."""
+    app = current_app._get_current_object()
+    stop_event = threading.Event()
+
+    def shutdown(signum, frame):
+        click.echo('Shutting down after running jobs finish...')
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    click.echo(f"Job worker started ({concurrency} slots, jobs: {', '.join(sorted(_registry))})")
+    run_worker(app, concurrency=concurrency, poll_interval=poll_interval, stop_event=stop_event)
+    click.echo('Job worker stopped.')
+
+
+# --- Status polling ---
+
+@jobs_bp.route('/<int:job_id>')
+@login_required
+def job_status(job_id):
+    queued = Job.query.get_or_404(job_id)
+    if current_user.role != 'admin' and queued.user_id != current_user.id:
+        abort(403)
+    return queued.to_dict()
+
+
+@jobs_bp.route('/')
+@login_required
+def job_list():
+    if current_user.role != 'admin':
+        abort(403)
+    query = Job.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(Job.id.desc()).limit(min(request.args.get('limit', 50, type=int), 500)).all()
+    return {'jobs': [j.to_dict() for j in jobs]}
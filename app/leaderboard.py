@@ -0,0 +1,178 @@
+import click
+from flask.cli import with_appcontext
+
+from app import db
+from app.models import (CourseScore, Module, Lesson, Quiz, QuizResult, Assignment, Submission, LessonProgress,
+                        enrollments)
+from app.versions import bump_version
+
+# Per-course leaderboards. Every enrolled student has a CourseScore row that the write paths
+# adjust by the difference they make (a better quiz score, a lesson completed or un-completed,
+# a grade changed), so reading a leaderboard never aggregates results. Points:
+#   quizzes      best score per quiz (0-100)
+#   lessons      LESSON_POINTS per completed lesson
+#   assignments  the grade of each submission
+# Version key leaderboard:<course_id> changes with every adjustment.
+
+LESSON_POINTS = 10
+LEADERBOARD_SIZE = 10
+
+_ADJUST = (
+    db.update(CourseScore.__table__)
+    .where(CourseScore.course_id == db.bindparam('b_course'), CourseScore.user_id == db.bindparam('b_user'))
+    .values(quiz_points=CourseScore.quiz_points + db.bindparam('b_quiz'),
+            lesson_points=CourseScore.lesson_points + db.bindparam('b_lessons'),
+            assignment_points=CourseScore.assignment_points + db.bindparam('b_assignments'),
+            points=CourseScore.points + db.bindparam('b_quiz') + db.bindparam('b_lessons')
+            + db.bindparam('b_assignments'))
+)
+
+
+def adjust_scores(course_id, deltas, kind):
+    """Add {user_id: delta} to one kind of points ('quiz', 'lessons' or 'assignments').
+
+    Students without a row (not enrolled) are left out by the UPDATE itself.
+    """
+    rows = [{'b_course': course_id, 'b_user': user_id, 'b_quiz': 0, 'b_lessons': 0, 'b_assignments': 0,
+             f'b_{kind}': delta} for user_id, delta in deltas.items() if delta]
+    if not rows:
+        return
+    db.session.execute(_ADJUST, rows)
+    bump_version(f'leaderboard:{course_id}')
+
+
+def record_quiz_score(user_id, quiz, score):
+    """Call before the new QuizResult is added: only an improvement on the best attempt counts.
+
+    The best earlier attempt is read by the UPDATE itself, so two submits at once can't both
+    add the same improvement (the second one runs after the first has committed its result).
+    """
+    course_id = db.select(Module.course_id).join(Lesson, Lesson.module_id == Module.id).where(
+        Lesson.id == quiz.lesson_id).scalar_subquery()
+    best = db.select(db.func.coalesce(db.func.max(QuizResult.score), 0)).where(
+        QuizResult.user_id == user_id, QuizResult.quiz_id == quiz.id).scalar_subquery()
+    improved = db.session.execute(
+        db.update(CourseScore.__table__)
+        .where(CourseScore.course_id == course_id, CourseScore.user_id == user_id, best < score)
+        .values(quiz_points=CourseScore.quiz_points + score - best, points=CourseScore.points + score - best)
+        .returning(CourseScore.course_id)
+    ).scalar()
+    if improved is not None:
+        bump_version(f'leaderboard:{improved}')
+
+
+def record_lesson_completion(user_id, lesson, completed):
+    adjust_scores(lesson.module.course_id, {user_id: LESSON_POINTS if completed else -LESSON_POINTS}, 'lessons')
+
+
+def record_grade_changes(course_id, changes):
+    """changes: (user_id, old_grade, new_grade) per submission; None counts as 0."""
+    deltas = {}
+    for user_id, old, new in changes:
+        deltas[user_id] = deltas.get(user_id, 0) + (new or 0) - (old or 0)
+    adjust_scores(course_id, deltas, 'assignments')
+
+
+# --- Reads ---
+
+def top_scores(course_id, limit=LEADERBOARD_SIZE):
+    """The first `limit` (rank, CourseScore) pairs, with the student loaded."""
+    rows = (CourseScore.query.options(db.joinedload(CourseScore.student))
+            .filter_by(course_id=course_id)
+            .order_by(CourseScore.points.desc(), CourseScore.user_id)
+            .limit(limit).all())
+    return list(enumerate(rows, 1))
+
+
+def rank_of(course_id, user_id):
+    """(rank, CourseScore) of one student, or None if they have no score in the course.
+
+    The rank is one plus the number of rows ahead in the ranking order, counted on the index.
+    """
+    score = db.session.get(CourseScore, (course_id, user_id))
+    if score is None:
+        return None
+    ahead = db.session.execute(
+        db.select(db.func.count()).select_from(CourseScore).where(
+            CourseScore.course_id == course_id,
+            db.or_(CourseScore.points > score.points,
+                   db.and_(CourseScore.points == score.points, CourseScore.user_id < user_id)))
+    ).scalar()
+    return ahead + 1, score
+
+
+def participant_count(course_id):
+    return db.session.execute(
+        db.select(db.func.count()).select_from(CourseScore).where(CourseScore.course_id == course_id)
+    ).scalar()
+
+
+# --- Rebuilding ---
+
+def _totals(stmt):
+    return {(course_id, user_id): total for course_id, user_id, total in db.session.execute(stmt)}
+
+
+def rebuild_scores(course_id=None, user_ids=None):
+    """Recompute the rows of one course (or all) from scratch, optionally for some students only.
+
+    Used to backfill, after content is deleted, and when a student is enrolled.
+    """
+    def scoped(stmt, course_col, user_col):
+        if course_id is not None:
+            stmt = stmt.where(course_col == course_id)
+        if user_ids is not None:
+            stmt = stmt.where(user_col.in_(user_ids))
+        return stmt
+
+    best = (db.select(QuizResult.user_id, QuizResult.quiz_id, db.func.max(QuizResult.score).label('best'))
+            .group_by(QuizResult.user_id, QuizResult.quiz_id).subquery())
+    quiz = _totals(scoped(
+        db.select(Module.course_id, best.c.user_id, db.func.sum(best.c.best)).select_from(best)
+        .join(Quiz, Quiz.id == best.c.quiz_id).join(Lesson, Lesson.id == Quiz.lesson_id)
+        .join(Module, Module.id == Lesson.module_id)
+        .group_by(Module.course_id, best.c.user_id), Module.course_id, best.c.user_id))
+    lessons = _totals(scoped(
+        db.select(Module.course_id, LessonProgress.user_id, db.func.count() * LESSON_POINTS)
+        .join(Lesson, Lesson.id == LessonProgress.lesson_id).join(Module, Module.id == Lesson.module_id)
+        .where(LessonProgress.is_completed == True)
+        .group_by(Module.course_id, LessonProgress.user_id), Module.course_id, LessonProgress.user_id))
+    assignments = _totals(scoped(
+        db.select(Module.course_id, Submission.user_id, db.func.coalesce(db.func.sum(Submission.grade), 0))
+        .join(Assignment, Assignment.id == Submission.assignment_id).join(Lesson, Lesson.id == Assignment.lesson_id)
+        .join(Module, Module.id == Lesson.module_id)
+        .group_by(Module.course_id, Submission.user_id), Module.course_id, Submission.user_id))
+    enrolled = db.session.execute(scoped(
+        db.select(enrollments.c.course_id, enrollments.c.user_id), enrollments.c.course_id, enrollments.c.user_id)
+    ).all()
+
+    db.session.execute(scoped(db.delete(CourseScore), CourseScore.course_id, CourseScore.user_id))
+    rows = []
+    for key in enrolled:
+        key = tuple(key)
+        parts = (quiz.get(key, 0), lessons.get(key, 0), assignments.get(key, 0))
+        rows.append({'course_id': key[0], 'user_id': key[1], 'quiz_points': parts[0], 'lesson_points': parts[1],
+                     'assignment_points': parts[2], 'points': sum(parts)})
+    if rows:
+        db.session.execute(db.insert(CourseScore), rows)
+    courses = {c for c, _ in enrolled} | ({course_id} if course_id is not None else set())
+    bump_version(*(f'leaderboard:{c}' for c in courses))
+    return len(rows)
+
+
+def remove_scores(course_id, user_id=None):
+    stmt = db.delete(CourseScore).where(CourseScore.course_id == course_id)
+    if user_id is not None:
+        stmt = stmt.where(CourseScore.user_id == user_id)
+    db.session.execute(stmt)
+    bump_version(f'leaderboard:{course_id}')
+
+
+@click.command('rebuild-leaderboards')
+@click.option('--course', 'course_id', type=int, default=None, help='Only this course.')
+@with_appcontext
+def rebuild_leaderboards_command(course_id):
+    """Recompute leaderboard points from quiz results, lesson progress and grades."""
+    count = rebuild_scores(course_id)
+    db.session.commit()
+    click.echo(f'Rebuilt {count} leaderboard rows.')
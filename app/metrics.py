@@ -0,0 +1,121 @@
+import hmac
+import os
+import time
+from functools import wraps
+
+from flask import Blueprint, Response, g, request, abort, has_request_context, current_app
+from flask_login import current_user
+
+# Samples are written to per-process files in METRICS_DIR and merged when /metrics is scraped,
+# so the numbers add up across gunicorn workers. prometheus_client picks its value storage when
+# it is imported, so init_metrics() sets PROMETHEUS_MULTIPROC_DIR first and only then imports it
+# and defines the metrics.
+
+metrics_bp = Blueprint('metrics', __name__)
+_enabled = False
+METRICS_DIR = None
+
+
+def _define_metrics():
+    global REQUEST_LATENCY, REQUESTS, IN_FLIGHT, RESPONSE_SIZE, DB_TIME, BCRYPT_TIME, UPLOAD_BYTES
+    from prometheus_client import Counter, Gauge, Histogram
+    REQUEST_LATENCY = Histogram('lms_request_duration_seconds', 'Request latency.', ['endpoint', 'method'],
+                                buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+    REQUESTS = Counter('lms_requests_total', 'Requests handled.', ['endpoint', 'method', 'status'])
+    IN_FLIGHT = Gauge('lms_requests_in_flight', 'Requests being handled.', multiprocess_mode='livesum')
+    RESPONSE_SIZE = Histogram('lms_response_size_bytes', 'Response body size.', ['endpoint'],
+                              buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+    DB_TIME = Histogram('lms_request_db_seconds', 'Time spent in SQL per request.', ['endpoint'],
+                        buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+    BCRYPT_TIME = Histogram('lms_bcrypt_seconds', 'Password hashing and checking time.', ['operation'],
+                            buckets=(.05, .1, .2, .3, .5, .75, 1, 2))
+    UPLOAD_BYTES = Counter('lms_upload_bytes_total', 'Bytes received in file uploads.', ['endpoint'])
+
+
+def _endpoint():
+    # Unmatched URLs share one label so scanners can't blow up the series count
+    return request.endpoint or 'unmatched'
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _record_response(response):
+    g.metrics_status = response.status_code
+    size = response.content_length # None for streamed bodies
+    if size is not None:
+        RESPONSE_SIZE.labels(_endpoint()).observe(size)
+    return response
+
+
+def _stop_timer(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    IN_FLIGHT.dec()
+    endpoint = _endpoint()
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - start)
+    REQUESTS.labels(endpoint, request.method, str(g.pop('metrics_status', 500))).inc()
+    stats = g.get('query_stats') # Filled in by app/query_stats.py when QUERY_STATS is on
+    if stats is not None:
+        DB_TIME.labels(endpoint).observe(stats.seconds)
+
+
+def _timed(fn, histogram):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def record_upload(size):
+    if _enabled:
+        UPLOAD_BYTES.labels(_endpoint() if has_request_context() else 'background').inc(size)
+
+
+def _authorized():
+    # Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; anyone else needs an admin session
+    token = current_app.config.get('METRICS_TOKEN')
+    sent = request.headers.get('Authorization', '')
+    if token and sent.startswith('Bearer ') and hmac.compare_digest(sent[len('Bearer '):].encode(), token.encode()):
+        return True
+    return current_user.is_authenticated and current_user.role == 'admin'
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    from prometheus_client import CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.multiprocess import MultiProcessCollector
+    if not _authorized():
+        abort(403)
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=METRICS_DIR)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    global _enabled, METRICS_DIR
+    if not app.config.get('METRICS'):
+        return
+    if METRICS_DIR is None:
+        # gunicorn.conf.py sets the variable first for the whole server, and then it wins
+        METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', app.config['METRICS_DIR'])
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        try:
+            _define_metrics()
+        except ImportError: # Metrics are optional
+            METRICS_DIR = None
+            return
+    _enabled = True
+    from app import bcrypt
+    if not hasattr(bcrypt.check_password_hash, '__wrapped__'): # create_app may run more than once
+        bcrypt.generate_password_hash = _timed(bcrypt.generate_password_hash, BCRYPT_TIME.labels('hash'))
+        bcrypt.check_password_hash = _timed(bcrypt.check_password_hash, BCRYPT_TIME.labels('check'))
+
+    app.before_request(_start_timer)
+    app.after_request(_record_response)
+    app.teardown_request(_stop_timer)
+    app.register_blueprint(metrics_bp)
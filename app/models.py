@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db, login_manager
 from flask_login import UserMixin
@@ -16,7 +17,7 @@ class User(db.Model, UserMixin):
     profile_image = db.Column(db.String(150), nullable=True, default='default_avatar.png')
     role = db.Column(db.String(20), nullable=False, default='student') # admin, student
     status = db.Column(db.String(20), nullable=False, default='pending') # pending, approved, rejected
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     enrolled_courses = db.relationship('Course', secondary='enrollments', backref=db.backref('students', lazy=True))
 
     def __repr__(self):
@@ -73,7 +74,7 @@ class LessonProgress(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id'), nullable=False)
     is_completed = db.Column(db.Boolean, default=False)
-    completed_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True, index=True)
     
     # Ensure a user has only one progress record per lesson
     __table_args__ = (db.UniqueConstraint('user_id', 'lesson_id', name='unique_user_lesson_progress'),)
@@ -122,7 +123,24 @@ class QuizResult(db.Model):
     score = db.Column(db.Integer, nullable=False) # Percentage or raw score
     passed = db.Column(db.Boolean, default=False)
     answers = db.Column(db.Text, nullable=True) # Storing user answers as JSON: {question_id: option_index}
-    attempted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# One student's attempts at one quiz, newest last: latest/best attempt lookups and the retention job
+db.Index('ix_quiz_result_user_quiz', QuizResult.user_id, QuizResult.quiz_id, QuizResult.attempted_at)
+
+class QuizResultArchive(db.Model):
+    # Older QuizResult attempts moved out of the hot table by app.quiz_archive (same ids)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    passed = db.Column(db.Boolean, default=False)
+    answers = db.Column(db.LargeBinary, nullable=True) # One byte per question in id order: option index + 1, 0 if unanswered
+    layout = db.Column(db.String(16), nullable=True) # Hash of the question ids the answers were packed against
+    attempted_at = db.Column(db.DateTime, nullable=True, index=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_quiz_result_archive_user_quiz', 'user_id', 'quiz_id'),)
 
 class Assignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -146,20 +164,174 @@ class Submission(db.Model):
     file_path = db.Column(db.String(300), nullable=False) # Path to uploaded file
     grade = db.Column(db.Integer, nullable=True)
     feedback = db.Column(db.Text, nullable=True)
-    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # User relationship
     student = db.relationship('User', backref='submissions')
 
+    # One submission per student and assignment; resubmitting replaces the file
+    __table_args__ = (db.UniqueConstraint('user_id', 'assignment_id', name='unique_user_assignment_submission'),)
+
     def __repr__(self):
         return f"Submission(User: {self.user_id}, Assignment: {self.assignment_id})"
 
 class Notification(db.Model):
+    # Shown to every admin; who has read what lives in NotificationCursor / NotificationRead (app.notifications)
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.String(255), nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
     link = db.Column(db.String(300), nullable=True) # Link to the relevant page (e.g., submission review)
+    group_key = db.Column(db.String(100), nullable=True, index=True) # Events with the same key are coalesced
+    count = db.Column(db.Integer, nullable=False, default=1) # Events folded into this row
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True) # Latest event
 
     def __repr__(self):
         return f"Notification('{self.message}')"
+
+class NotificationCursor(db.Model):
+    # One admin has read every notification with an id up to read_up_to
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    read_up_to = db.Column(db.Integer, nullable=False, default=0)
+
+class NotificationRead(db.Model):
+    # A notification above the admin's cursor dismissed on its own
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), primary_key=True)
+
+class UploadBlob(db.Model):
+    # One file on disk per distinct content, shared by every row that references it
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(300), unique=True, nullable=False) # Relative to UPLOAD_FOLDER
+    original_name = db.Column(db.String(255), nullable=True) # Name of the first upload, used for downloads
+    size = db.Column(db.Integer, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"UploadBlob('{self.path}', refs={self.ref_count})"
+
+class DataVersion(db.Model):
+    # Counters bumped whenever the data behind a cache key changes, e.g. 'course:3' or 'progress:12'
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DataVersion('{self.key}', {self.version})"
+
+class CourseScore(db.Model):
+    # Leaderboard points of one enrolled student in one course, kept up to date by app.leaderboard
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    quiz_points = db.Column(db.Integer, nullable=False, default=0) # Sum of the best score per quiz
+    lesson_points = db.Column(db.Integer, nullable=False, default=0) # LESSON_POINTS per completed lesson
+    assignment_points = db.Column(db.Integer, nullable=False, default=0) # Sum of assignment grades
+    points = db.Column(db.Integer, nullable=False, default=0) # Total, the ranking key
+
+    student = db.relationship('User')
+
+    def __repr__(self):
+        return f"CourseScore(Course: {self.course_id}, User: {self.user_id}, {self.points})"
+
+# Ranking order (points high to low, ties by user id): top-N and rank counts are index range scans
+db.Index('ix_course_score_rank', CourseScore.course_id, CourseScore.points.desc(), CourseScore.user_id)
+
+class ResumePoint(db.Model):
+    # Where one student left off in one course, kept up to date by app.resume
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    last_lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id'), nullable=True) # Last lesson opened or marked
+    last_completed = db.Column(db.Boolean, nullable=False, default=False) # Whether that lesson was completed then
+    next_lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id'), nullable=True) # First incomplete, in course order
+    visited_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def resume_lesson_id(self):
+        # The lesson left unfinished, else the first one not completed yet (the last one once all are)
+        if self.last_lesson_id and not self.last_completed:
+            return self.last_lesson_id
+        return self.next_lesson_id or self.last_lesson_id
+
+    def __repr__(self):
+        return f"ResumePoint(User: {self.user_id}, Course: {self.course_id}, Lesson: {self.resume_lesson_id})"
+
+class VideoProgress(db.Model):
+    # Playback position of one student in one lesson video, written in batches by app.watch
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id'), primary_key=True)
+    position = db.Column(db.Float, nullable=False, default=0) # Seconds into the video at the last heartbeat
+    furthest = db.Column(db.Float, nullable=False, default=0) # Furthest position reported so far
+    duration = db.Column(db.Float, nullable=True) # As reported by the player
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"VideoProgress(User: {self.user_id}, Lesson: {self.lesson_id}, {self.position}/{self.duration})"
+
+class ActivityEvent(db.Model):
+    # Append-only log of what learners do, written in batches by app.activity (never updated)
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.SmallInteger, nullable=False) # One of the event constants in app.activity
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    object_id = db.Column(db.Integer, nullable=True) # Lesson, quiz, result, submission or assignment, by type
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_activity_event_created_at', 'created_at'),
+                      db.Index('ix_activity_event_user_created_at', 'user_id', 'created_at'))
+
+    def __repr__(self):
+        return f"ActivityEvent({self.type}, User: {self.user_id}, Object: {self.object_id})"
+
+class DailyCourseStats(db.Model):
+    # One row per course and UTC day, written by app.rollups; the admin analytics page reads only these
+    day = db.Column(db.Date, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    active_students = db.Column(db.Integer, nullable=False, default=0)
+    lessons_completed = db.Column(db.Integer, nullable=False, default=0)
+    quiz_attempts = db.Column(db.Integer, nullable=False, default=0)
+    quizzes_passed = db.Column(db.Integer, nullable=False, default=0)
+    submissions = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DailyCourseStats({self.day}, Course: {self.course_id})"
+
+class DailySignupStats(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    registrations = db.Column(db.Integer, nullable=False, default=0)
+    approvals = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DailySignupStats({self.day}, {self.registrations}/{self.approvals})"
+
+class Job(db.Model):
+    # Background work queued by request handlers and run by `flask jobs-worker`
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}') # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True) # Lease: set on claim, renewed while the job runs
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True) # JSON return value
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # Who queued it, for status polling
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'last_error': self.last_error,
+            'result': json.loads(self.result) if self.result else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"Job({self.id}, '{self.name}', '{self.status}')"
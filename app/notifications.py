@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import Notification, NotificationCursor, NotificationRead, User
+
+# Admin notifications. Every admin sees every notification; what one admin has read is a cursor
+# (NotificationCursor: every id up to read_up_to) plus the notifications above it dismissed one
+# by one (NotificationRead), so "mark all read" is one row per admin however many there are.
+# Events passed with a group_key are folded into the newest row of that key while no admin has
+# read it ("200 new submissions in ..." instead of 200 rows); once someone has, the next event
+# starts a new row. Notifications every admin has read are deleted after
+# NOTIFICATION_RETENTION_DAYS, NOTIFICATION_ARCHIVE_BATCH rows at a time: each new row pays for
+# one batch, and `flask archive-notifications` clears a backlog.
+
+
+def _read_by(user_id, notification_id):
+    """SQL condition: the admin has read the notification (either column may be correlated)."""
+    cursor = db.select(NotificationCursor.read_up_to).where(NotificationCursor.user_id == user_id).scalar_subquery()
+    return db.or_(
+        db.func.coalesce(cursor, 0) >= notification_id,
+        db.exists().where(NotificationRead.user_id == user_id, NotificationRead.notification_id == notification_id),
+    )
+
+
+def unread_notifications(user_id):
+    """The admin's unread notifications, latest activity first, with one query."""
+    return Notification.query.filter(~_read_by(user_id, Notification.id)).order_by(
+        Notification.updated_at.desc(), Notification.id.desc()).all()
+
+
+def mark_read(user_id, notification_id):
+    db.session.execute(insert(NotificationRead).values(user_id=user_id, notification_id=notification_id)
+                       .on_conflict_do_nothing())
+
+
+def mark_all_read(user_id, up_to, seen_at=None):
+    """Mark what the admin saw as read: ids up to up_to, as they were at seen_at (their newest updated_at).
+
+    A row an event was folded into after the page was shown stays unread: the cursor stops below
+    it and the other rows up to up_to are marked one by one. The cursor never moves back, and the
+    dismissals it covers are dropped.
+    """
+    if seen_at is not None:
+        changed = db.session.execute(
+            db.select(db.func.min(Notification.id)).where(Notification.id <= up_to, Notification.updated_at > seen_at)
+        ).scalar()
+        if changed is not None:
+            db.session.execute(insert(NotificationRead).from_select(
+                ['user_id', 'notification_id'],
+                db.select(db.literal(user_id), Notification.id)
+                .where(Notification.id > changed, Notification.id <= up_to, Notification.updated_at <= seen_at),
+            ).on_conflict_do_nothing())
+            up_to = changed - 1
+    upsert = insert(NotificationCursor).values(user_id=user_id, read_up_to=up_to)
+    db.session.execute(upsert.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'read_up_to': db.func.max(NotificationCursor.read_up_to, upsert.excluded.read_up_to)},
+    ))
+    db.session.execute(db.delete(NotificationRead).where(NotificationRead.user_id == user_id,
+                                                         NotificationRead.notification_id <= up_to))
+
+
+def notify(message, link=None, group_key=None, group_message=None):
+    """Add a notification for the admins in the current transaction.
+
+    With a group_key the event is counted into the newest unread row of that key, whose message
+    becomes group_message with {count} replaced by the new total; returns the row's id.
+    """
+    now = datetime.utcnow()
+    if group_key is not None:
+        latest = db.aliased(Notification)
+        open_row = (db.select(latest.id)
+                    .where(latest.group_key == group_key, ~db.exists().where(User.role == 'admin',
+                                                                            _read_by(User.id, latest.id)))
+                    .order_by(latest.id.desc()).limit(1).scalar_subquery())
+        coalesced = db.session.execute(
+            db.update(Notification).where(Notification.id == open_row)
+            .values(count=Notification.count + 1, updated_at=now, link=link,
+                    message=db.func.replace(group_message or message, '{count}',
+                                            db.cast(Notification.count + 1, db.String)))
+            .returning(Notification.id)
+        ).scalar()
+        if coalesced is not None:
+            return coalesced
+
+    notification_id = db.session.execute(
+        db.insert(Notification).values(message=message, link=link, group_key=group_key, count=1,
+                                       created_at=now, updated_at=now).returning(Notification.id)
+    ).scalar()
+    archive_read_notifications()
+    return notification_id
+
+
+def archive_read_notifications(limit=None):
+    """Delete up to limit notifications read by every admin and older than the retention; returns how many."""
+    config = current_app.config
+    limit = limit or config.get('NOTIFICATION_ARCHIVE_BATCH', 500)
+    cutoff = datetime.utcnow() - timedelta(days=config.get('NOTIFICATION_RETENTION_DAYS', 30))
+    expired = db.session.execute(
+        db.select(Notification.id)
+        .where(Notification.updated_at < cutoff,
+               ~db.exists().where(User.role == 'admin', ~_read_by(User.id, Notification.id)))
+        .order_by(Notification.id).limit(limit)
+    ).scalars().all()
+    if expired:
+        db.session.execute(db.delete(NotificationRead).where(NotificationRead.notification_id.in_(expired)))
+        db.session.execute(db.delete(Notification).where(Notification.id.in_(expired)))
+    return len(expired)
+
+
+@click.command('archive-notifications')
+@with_appcontext
+def archive_notifications_command():
+    """Delete every notification all admins have read that is older than the retention."""
+    total = 0
+    while True:
+        deleted = archive_read_notifications()
+        db.session.commit()
+        total += deleted
+        if deleted < current_app.config.get('NOTIFICATION_ARCHIVE_BATCH', 500):
+            break
+    click.echo(f'Deleted {total} read notifications.')
@@ -0,0 +1,177 @@
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, current_app
+from flask_login import current_user
+
+# Opt-in request profiler. A sampled request gets a helper thread that snapshots the request
+# thread's stack every PROFILE_INTERVAL_MS; the request itself runs untouched. Stacks are written
+# in collapsed format ("outer;inner;leaf count" per line), which flamegraph.pl, speedscope and
+# similar tools read directly, to PROFILE_DIR/<endpoint>/<timestamp>_<duration>ms_<id>.collapsed.
+
+PROFILE_SUFFIX = '.collapsed'
+
+
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def profile_dir(app=None):
+    app = app or current_app
+    return app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+
+def _should_profile():
+    if request.endpoint in (None, 'static'):
+        return False
+    # Admins can ask for a profile of a single request
+    if request.headers.get('X-Profile') and current_user.is_authenticated and current_user.role == 'admin':
+        return True
+    rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+    if not _should_profile():
+        return
+    sampler = StackSampler(threading.get_ident(), current_app.config.get('PROFILE_INTERVAL_MS', 5) / 1000)
+    g.profile = (sampler, time.perf_counter(), uuid.uuid4().hex[:8])
+    sampler.start()
+
+
+def _tag_response(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile[2]
+    return response
+
+
+def _finish_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    sampler, start, profile_id = profile
+    samples = sampler.stop()
+    duration_ms = int((time.perf_counter() - start) * 1000)
+    if not samples:
+        return
+
+    directory = os.path.join(profile_dir(), request.endpoint)
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S}_{duration_ms}ms_{profile_id}{PROFILE_SUFFIX}"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune(directory, current_app.config.get('PROFILE_KEEP', 50))
+    except OSError as e:
+        current_app.logger.warning('Could not save profile for %s: %s', request.endpoint, e)
+
+
+def _prune(directory, keep):
+    names = sorted(n for n in os.listdir(directory) if n.endswith(PROFILE_SUFFIX))
+    for name in names[:-keep]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def _parse_name(endpoint, name):
+    stamp, duration, profile_id = name[:-len(PROFILE_SUFFIX)].split('_')
+    return {
+        'endpoint': endpoint,
+        'name': name,
+        'id': profile_id,
+        'taken_at': datetime.strptime(stamp, '%Y%m%dT%H%M%S'),
+        'duration_ms': int(duration[:-2]),
+    }
+
+
+def list_profiles():
+    """Saved profiles grouped by endpoint, slowest first: {endpoint: [profile, ...]}."""
+    root = profile_dir()
+    if not os.path.isdir(root):
+        return {}
+    grouped = {}
+    for endpoint in sorted(os.listdir(root)):
+        directory = os.path.join(root, endpoint)
+        if not os.path.isdir(directory):
+            continue
+        profiles = []
+        for name in os.listdir(directory):
+            try:
+                profiles.append(_parse_name(endpoint, name))
+            except ValueError:
+                continue # Not one of ours
+        if profiles:
+            grouped[endpoint] = sorted(profiles, key=lambda p: p['duration_ms'], reverse=True)
+    return grouped
+
+
+def profile_path(endpoint, name):
+    """Path of a saved profile, or None if the names don't point inside PROFILE_DIR."""
+    root = os.path.realpath(profile_dir())
+    path = os.path.realpath(os.path.join(root, endpoint, name))
+    if not path.startswith(root + os.sep) or not path.endswith(PROFILE_SUFFIX) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def top_frames(path, limit=25):
+    """(self samples, total samples, function) for the hottest functions of a profile."""
+    own = Counter()
+    inclusive = Counter()
+    total = 0
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            count = int(count)
+            frames = stack.split(';')
+            total += count
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+    rows = [(own[frame], inclusive[frame], frame) for frame in inclusive]
+    rows.sort(key=lambda r: (r[0], r[1]), reverse=True)
+    return total, rows[:limit]
+
+
+def init_profiling(app):
+    app.before_request(_start_profile)
+    app.after_request(_tag_response)
+    app.teardown_request(_finish_profile)
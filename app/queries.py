@@ -0,0 +1,88 @@
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import (Course, Module, Lesson, Submission, QuizResult,
+                        LessonProgress, enrollments)
+
+# Per-student lookups shared by the HTML views and the JSON API. Each helper runs one query
+# (or one per eager-loaded level) regardless of how many courses or lessons are involved.
+
+
+def enrolled_course_ids(user_id):
+    rows = db.session.execute(db.select(enrollments.c.course_id).where(enrollments.c.user_id == user_id))
+    return [course_id for (course_id,) in rows]
+
+
+def outline_options(lessons=True):
+    """Loader options for Course -> modules -> lessons (-> quiz, assignment), one SELECT per level."""
+    modules = selectinload(Course.modules)
+    if not lessons:
+        return [modules]
+    return [modules.selectinload(Module.lessons).options(selectinload(Lesson.quiz),
+                                                         selectinload(Lesson.assignment))]
+
+
+def load_courses(course_ids, lessons=True):
+    """Courses with their outline eagerly loaded, in the order of course_ids."""
+    if not course_ids:
+        return []
+    courses = {c.id: c for c in Course.query.options(*outline_options(lessons))
+               .filter(Course.id.in_(course_ids)).all()}
+    return [courses[i] for i in course_ids if i in courses]
+
+
+def completed_lesson_ids(user_id, lesson_ids=None):
+    query = db.select(LessonProgress.lesson_id).where(LessonProgress.user_id == user_id,
+                                                      LessonProgress.is_completed == True)
+    if lesson_ids is not None:
+        query = query.where(LessonProgress.lesson_id.in_(lesson_ids))
+    return {lesson_id for (lesson_id,) in db.session.execute(query)}
+
+
+def latest_quiz_results(user_id, quiz_ids=None):
+    """{quiz_id: QuizResult} with the most recent attempt per quiz."""
+    ranked = db.select(
+        QuizResult.id,
+        db.func.row_number().over(partition_by=QuizResult.quiz_id,
+                                  order_by=(QuizResult.attempted_at.desc(), QuizResult.id.desc())).label('rank'),
+    ).where(QuizResult.user_id == user_id)
+    if quiz_ids is not None:
+        ranked = ranked.where(QuizResult.quiz_id.in_(quiz_ids))
+    ranked = ranked.subquery()
+    results = QuizResult.query.join(ranked, ranked.c.id == QuizResult.id).filter(ranked.c.rank == 1).all()
+    return {r.quiz_id: r for r in results}
+
+
+def user_submissions(user_id, assignment_ids=None):
+    """{assignment_id: Submission} for one student."""
+    query = Submission.query.filter_by(user_id=user_id)
+    if assignment_ids is not None:
+        query = query.filter(Submission.assignment_id.in_(assignment_ids))
+    return {s.assignment_id: s for s in query.all()}
+
+
+def course_progress(user_id, course_ids):
+    """{course_id: (completed_lessons, total_lessons)} from two grouped queries."""
+    totals = dict(db.session.execute(
+        db.select(Module.course_id, db.func.count(Lesson.id))
+        .join(Lesson, Lesson.module_id == Module.id)
+        .where(Module.course_id.in_(course_ids))
+        .group_by(Module.course_id)
+    ).all())
+    completed = dict(db.session.execute(
+        db.select(Module.course_id, db.func.count(LessonProgress.id))
+        .join(Lesson, Lesson.module_id == Module.id)
+        .join(LessonProgress, LessonProgress.lesson_id == Lesson.id)
+        .where(Module.course_id.in_(course_ids), LessonProgress.user_id == user_id,
+               LessonProgress.is_completed == True)
+        .group_by(Module.course_id)
+    ).all())
+    return {course_id: (completed.get(course_id, 0), totals.get(course_id, 0)) for course_id in course_ids}
+
+
+def course_items(model, course_ids):
+    """Query for the quizzes or assignments of the given courses, with the course id alongside."""
+    return (db.session.query(model, Module.course_id)
+            .join(Lesson, model.lesson_id == Lesson.id)
+            .join(Module, Lesson.module_id == Module.id)
+            .filter(Module.course_id.in_(course_ids)))
@@ -0,0 +1,78 @@
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request, current_app
+from sqlalchemy import event
+
+from app import db
+
+# Per-request SQL instrumentation. Engine events add a counter bump and two perf_counter()
+# calls per query, so it is cheap enough to leave on in production:
+#   - every query slower than QUERY_STATS_SLOW_MS is logged with its route
+#   - a statement executed more than QUERY_STATS_N_PLUS_ONE times in one request (same SQL,
+#     different parameters) is logged as a likely N+1
+#   - in debug mode responses carry X-Query-Count and X-DB-Time (ms)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated(self, threshold):
+        return [(sql, n) for sql, n in self.statements.most_common() if n > threshold]
+
+
+def current_stats():
+    """QueryStats for the running request (or app context), created on first use."""
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = QueryStats()
+    return stats
+
+
+def _route():
+    return request.endpoint or request.path if has_request_context() else 'background'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's execution context, so a statement that raises leaves nothing behind
+    context._query_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_stats_start
+    if has_request_context():
+        stats = current_stats()
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+
+    slow_ms = current_app.config.get('QUERY_STATS_SLOW_MS', 200)
+    if elapsed * 1000 >= slow_ms:
+        current_app.logger.warning('Slow query (%.0f ms) on %s: %s', elapsed * 1000, _route(), ' '.join(statement.split())[:1000])
+
+
+def _report(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+
+    for sql, n in stats.repeated(current_app.config.get('QUERY_STATS_N_PLUS_ONE', 10)):
+        current_app.logger.warning('Possible N+1 on %s: %d executions of %s', _route(), n, ' '.join(sql.split())[:300])
+
+    if current_app.debug or current_app.config.get('QUERY_STATS_HEADERS'):
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-DB-Time'] = f'{stats.seconds * 1000:.1f}'
+    return response
+
+
+def init_query_stats(app):
+    if not app.config.get('QUERY_STATS'):
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.after_request(_report)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db
+from app.jobs import job, enqueue
+from app.models import QuizResult, QuizResultArchive, Question
+from app.versions import bump_version
+
+# Retention for quiz attempts. Per student and quiz the hot QuizResult table keeps the latest
+# QUIZ_RESULTS_KEEP_LATEST attempts plus the best one (the leaderboard and gradebook read both);
+# older attempts move to QuizResultArchive under the same id, so result pages keep working.
+# Archived answers are packed as one byte per question of the quiz, in question id order
+# (option index + 1, 0 when unanswered), instead of the {"question_id": index} JSON, next to a
+# hash of those question ids: editing a quiz recreates its questions, and answers packed against
+# another layout are shown as unanswered rather than matched to the wrong questions. The
+# compaction runs as a job over QUIZ_ARCHIVE_BATCH_USERS students at a time and queues itself
+# for the next batch, so every step is a short transaction.
+
+
+def pack_answers(answers, question_ids):
+    """{"question_id": option_index} JSON -> bytes in question_ids order."""
+    try:
+        chosen = json.loads(answers) if answers else {}
+    except ValueError:
+        chosen = {}
+    packed = bytearray()
+    for question_id in question_ids:
+        option = chosen.get(str(question_id))
+        packed.append(option + 1 if isinstance(option, int) and 0 <= option < 255 else 0)
+    return bytes(packed)
+
+
+def layout_hash(question_ids):
+    """Identifies the question ids (and their order) answers were packed against."""
+    return hashlib.sha1(','.join(map(str, question_ids)).encode()).hexdigest()[:16]
+
+
+def unpack_answers(packed, question_ids, layout):
+    """Inverse of pack_answers; {} when the quiz's questions changed since the attempt was archived."""
+    if not packed or layout != layout_hash(question_ids):
+        return {}
+    return {str(question_id): byte - 1 for question_id, byte in zip(question_ids, packed) if byte}
+
+
+def question_ids(quiz_ids):
+    """{quiz_id: [question ids in order]} with one query."""
+    ids = {quiz_id: [] for quiz_id in quiz_ids}
+    rows = db.session.execute(
+        db.select(Question.quiz_id, Question.id).where(Question.quiz_id.in_(quiz_ids)).order_by(Question.id)
+    )
+    for quiz_id, question_id in rows:
+        ids[quiz_id].append(question_id)
+    return ids
+
+
+def archive_attempts(user_ids, keep_latest):
+    """Move the attempts of these students that fall outside the policy; returns how many moved."""
+    partition = (QuizResult.user_id, QuizResult.quiz_id)
+    ranked = db.select(
+        QuizResult.id,
+        db.func.row_number().over(partition_by=partition,
+                                  order_by=(QuizResult.attempted_at.desc(), QuizResult.id.desc())).label('recent'),
+        db.func.row_number().over(partition_by=partition,
+                                  order_by=(QuizResult.score.desc(), QuizResult.attempted_at, QuizResult.id)).label('best'),
+    ).where(QuizResult.user_id.in_(user_ids)).subquery()
+    expired = db.session.execute(
+        db.select(QuizResult.id, QuizResult.user_id, QuizResult.quiz_id, QuizResult.score, QuizResult.passed,
+                  QuizResult.answers, QuizResult.attempted_at)
+        .join(ranked, ranked.c.id == QuizResult.id)
+        .where(ranked.c.recent > keep_latest, ranked.c.best > 1)
+    ).all()
+    if not expired:
+        return 0
+
+    layouts = question_ids({row.quiz_id for row in expired})
+    now = datetime.utcnow()
+    db.session.execute(db.insert(QuizResultArchive), [
+        {'id': row.id, 'user_id': row.user_id, 'quiz_id': row.quiz_id, 'score': row.score, 'passed': row.passed,
+         'answers': pack_answers(row.answers, layouts[row.quiz_id]), 'layout': layout_hash(layouts[row.quiz_id]),
+         'attempted_at': row.attempted_at, 'archived_at': now}
+        for row in expired
+    ])
+    db.session.execute(db.delete(QuizResult).where(QuizResult.id.in_([row.id for row in expired])))
+    bump_version(*{f'progress:{row.user_id}' for row in expired}) # Attempt lists (API) lose these rows
+    return len(expired)
+
+
+def _next_users(after_user, limit):
+    return db.session.execute(
+        db.select(QuizResult.user_id).where(QuizResult.user_id > after_user).distinct()
+        .order_by(QuizResult.user_id).limit(limit)
+    ).scalars().all()
+
+
+def compact_batch(after_user=0):
+    """Apply the policy to the next batch of students; returns (archived, last user id or None when done)."""
+    limit = current_app.config.get('QUIZ_ARCHIVE_BATCH_USERS', 200)
+    users = _next_users(after_user, limit)
+    archived = archive_attempts(users, current_app.config.get('QUIZ_RESULTS_KEEP_LATEST', 3)) if users else 0
+    return archived, (users[-1] if len(users) == limit else None)
+
+
+@job('compact_quiz_results', concurrency=1)
+def compact_quiz_results(after_user=0):
+    archived, last_user = compact_batch(after_user)
+    if last_user is not None:
+        enqueue('compact_quiz_results', after_user=last_user) # Commits with this batch
+    return {'archived': archived, 'after_user': last_user}
+
+
+def ensure_indexes():
+    """Create the (user, quiz, attempted_at) index on databases created before it."""
+    for index in QuizResult.__table__.indexes:
+        if index.name == 'ix_quiz_result_user_quiz':
+            index.create(db.engine, checkfirst=True)
+
+
+@click.command('compact-quiz-results')
+@click.option('--queue', 'queue', is_flag=True, help='Queue the job for the worker instead of running it here.')
+@with_appcontext
+def compact_quiz_results_command(queue):
+    """Move quiz attempts outside the retention policy to the archive table."""
+    ensure_indexes()
+    if queue:
+        enqueue('compact_quiz_results')
+        db.session.commit()
+        click.echo('Queued compact_quiz_results.')
+        return
+    total, last_user = compact_batch()
+    db.session.commit()
+    while last_user is not None:
+        archived, last_user = compact_batch(last_user)
+        db.session.commit()
+        total += archived
+    click.echo(f'Archived {total} quiz attempts.')
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import ResumePoint, Lesson, Module, LessonProgress, enrollments
+from app.versions import bump_version
+
+# "Continue where you left off": one ResumePoint per student and course, holding the last lesson
+# the student opened or marked (and whether it was complete then) and the first lesson of the
+# course, in outline order, they have not completed. lesson_player and mark_complete refresh it
+# with a single INSERT .. ON CONFLICT whose values are computed by the database, and course
+# structure changes re-derive it for the whole course with one UPDATE, so the dashboard and the
+# API read it with one query and never walk the outline. Version key resume:<user_id>.
+
+
+def _course_of(lesson_id):
+    return db.select(Module.course_id).join(Lesson, Lesson.module_id == Module.id).where(Lesson.id == lesson_id)
+
+
+def _first_incomplete(user_id, course_id):
+    """Scalar subquery: the first lesson of the course the student has not completed (NULL if none)."""
+    done = db.select(LessonProgress.id).where(LessonProgress.user_id == user_id, LessonProgress.lesson_id == Lesson.id,
+                                              LessonProgress.is_completed == True)
+    return (db.select(Lesson.id).join(Module, Module.id == Lesson.module_id)
+            .where(Module.course_id == course_id, ~db.exists(done))
+            .order_by(Module.order_index, Lesson.order_index, Lesson.id).limit(1).scalar_subquery())
+
+
+def record_visit(user_id, lesson_id, completed=None):
+    """The student opened (or marked) a lesson; completed is its state afterwards (None: read it in the statement).
+
+    Only lessons of courses the student is enrolled in move a pointer: the row is selected from
+    the enrollment. Runs after the progress change is in the session: the statement autoflushes it first.
+    """
+    if completed is None:
+        completed = db.func.coalesce(
+            db.select(LessonProgress.is_completed)
+            .where(LessonProgress.user_id == user_id, LessonProgress.lesson_id == lesson_id).scalar_subquery(),
+            False)
+    else:
+        completed = db.literal(completed)
+    enrolled = (
+        db.select(enrollments.c.user_id, enrollments.c.course_id, db.literal(lesson_id), completed,
+                  _first_incomplete(user_id, enrollments.c.course_id), db.literal(datetime.utcnow()))
+        .where(enrollments.c.user_id == user_id, enrollments.c.course_id == _course_of(lesson_id).scalar_subquery())
+    )
+    stmt = insert(ResumePoint).from_select(
+        ['user_id', 'course_id', 'last_lesson_id', 'last_completed', 'next_lesson_id', 'visited_at'], enrolled)
+    written = db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'course_id'],
+        set_={column: stmt.excluded[column]
+              for column in ('last_lesson_id', 'last_completed', 'next_lesson_id', 'visited_at')},
+    ).returning(ResumePoint.user_id)).first()
+    if written:
+        bump_version(f'resume:{user_id}')
+
+
+def refresh_resume_points(course_id):
+    """Re-derive the pointers of a course after lessons were added, removed or reordered."""
+    lesson_ids = db.select(Lesson.id).join(Module, Module.id == Lesson.module_id).where(Module.course_id == course_id)
+    db.session.execute(
+        db.update(ResumePoint).where(ResumePoint.course_id == course_id)
+        .values(next_lesson_id=_first_incomplete(ResumePoint.user_id, ResumePoint.course_id),
+                last_lesson_id=db.case((ResumePoint.last_lesson_id.in_(lesson_ids), ResumePoint.last_lesson_id)))
+    )
+
+
+def remove_resume_points(course_id, user_id=None):
+    stmt = db.delete(ResumePoint).where(ResumePoint.course_id == course_id)
+    if user_id is not None:
+        stmt = stmt.where(ResumePoint.user_id == user_id)
+    db.session.execute(stmt)
+
+
+def resume_lessons(user_id, course_ids=None):
+    """{course_id: lesson_id} to continue from, for the courses the student has opened."""
+    query = ResumePoint.query.filter_by(user_id=user_id)
+    if course_ids is not None:
+        query = query.filter(ResumePoint.course_id.in_(course_ids))
+    return {point.course_id: point.resume_lesson_id for point in query.all() if point.resume_lesson_id}
@@ -0,0 +1,159 @@
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from app import db
+from app.activity import LESSON_VIEW, STUDENT_APPROVED
+from app.jobs import job
+from app.models import (DailyCourseStats, DailySignupStats, ActivityEvent, LessonProgress, QuizResult,
+                        QuizResultArchive, Submission, Quiz, Assignment, Lesson, Module, User)
+
+# Daily engagement rollups. Each run recomputes whole UTC days from the raw tables, reading
+# only rows inside those days through the timestamp indexes, and replaces their rows in
+# DailyCourseStats / DailySignupStats. By default a run starts at the last day already rolled
+# up (which may have been partial) and ends today, so a nightly or hourly run only touches
+# the new data. Per course and day:
+#   active_students    distinct students who viewed or completed a lesson, took a quiz or submitted
+#   lessons_completed  LessonProgress rows completed that day (completed_at is kept only for the
+#                      latest completion, so re-completions move to their new day)
+#   quiz_attempts, quizzes_passed, submissions (attempts include those archived by app.quiz_archive)
+# Signups per day: student registrations (User.created_at) and approvals (STUDENT_APPROVED events,
+# so only approvals made since the activity log exists are counted).
+
+
+def _day(column):
+    return db.func.date(column).label('day')
+
+
+def _in_days(column, start, end):
+    return db.and_(column >= datetime.combine(start, time.min), column < datetime.combine(end + timedelta(days=1), time.min))
+
+
+def _course_counts(start, end):
+    """{(day, course_id): {metric: value}} for the days start..end inclusive."""
+    lesson_course = (db.select(Lesson.id.label('lesson_id'), Module.course_id)
+                     .join(Module, Module.id == Lesson.module_id).subquery())
+    completed = (db.select(_day(LessonProgress.completed_at), lesson_course.c.course_id, LessonProgress.user_id)
+                 .join(lesson_course, lesson_course.c.lesson_id == LessonProgress.lesson_id)
+                 .where(LessonProgress.is_completed == True, _in_days(LessonProgress.completed_at, start, end)))
+    # Admins previewing lessons log views too
+    viewed = (db.select(_day(ActivityEvent.created_at), lesson_course.c.course_id, ActivityEvent.user_id)
+              .join(lesson_course, lesson_course.c.lesson_id == ActivityEvent.object_id)
+              .join(User, User.id == ActivityEvent.user_id)
+              .where(ActivityEvent.type == LESSON_VIEW, User.role == 'student',
+                     _in_days(ActivityEvent.created_at, start, end)))
+    # Attempts still in QuizResult plus those the retention job moved to the archive
+    attempts = db.union_all(*(
+        db.select(model.quiz_id, model.user_id, model.passed, model.attempted_at)
+        .where(_in_days(model.attempted_at, start, end)) for model in (QuizResult, QuizResultArchive)
+    )).subquery()
+    attempted = (db.select(_day(attempts.c.attempted_at), lesson_course.c.course_id, attempts.c.user_id)
+                 .join(Quiz, Quiz.id == attempts.c.quiz_id)
+                 .join(lesson_course, lesson_course.c.lesson_id == Quiz.lesson_id))
+    submitted = (db.select(_day(Submission.submitted_at), lesson_course.c.course_id, Submission.user_id)
+                 .join(Assignment, Assignment.id == Submission.assignment_id)
+                 .join(lesson_course, lesson_course.c.lesson_id == Assignment.lesson_id)
+                 .where(_in_days(Submission.submitted_at, start, end)))
+
+    counts = {}
+
+    def count(rows, metric):
+        rows = rows.subquery()
+        stmt = db.select(rows.c.day, rows.c.course_id, db.func.count()).group_by(rows.c.day, rows.c.course_id)
+        for day, course_id, n in db.session.execute(stmt):
+            counts.setdefault((day, course_id), {})[metric] = n
+
+    count(completed, 'lessons_completed')
+    count(attempted, 'quiz_attempts')
+    count(attempted.where(attempts.c.passed == True), 'quizzes_passed')
+    count(submitted, 'submissions')
+    # UNION (not UNION ALL) leaves one row per student, course and day
+    count(db.union(completed, viewed, attempted, submitted), 'active_students')
+    return counts
+
+
+def _signup_counts(start, end):
+    counts = {}
+    registrations = (db.select(_day(User.created_at), db.func.count())
+                     .where(User.role == 'student', _in_days(User.created_at, start, end)).group_by('day'))
+    approvals = (db.select(_day(ActivityEvent.created_at), db.func.count())
+                 .where(ActivityEvent.type == STUDENT_APPROVED, _in_days(ActivityEvent.created_at, start, end))
+                 .group_by('day'))
+    for stmt, metric in ((registrations, 'registrations'), (approvals, 'approvals')):
+        for day, value in db.session.execute(stmt):
+            counts.setdefault(day, {})[metric] = value
+    return counts
+
+
+def _first_day():
+    """Where a run starts: the last day rolled up, or the oldest data when nothing is yet."""
+    # DailySignupStats has a row for every day a run covered, so its last day is the watermark
+    last = db.session.execute(db.select(db.func.max(DailySignupStats.day))).scalar()
+    if last:
+        return last
+    oldest = [db.session.execute(db.select(db.func.min(column))).scalar()
+              for column in (LessonProgress.completed_at, QuizResult.attempted_at, QuizResultArchive.attempted_at,
+                             Submission.submitted_at, User.created_at, ActivityEvent.created_at)]
+    oldest = [d for d in oldest if d]
+    return min(oldest).date() if oldest else datetime.utcnow().date()
+
+
+def rollup_days(start=None, end=None):
+    """Recompute the daily rows for start..end (inclusive, UTC dates) and return how many were written."""
+    start = start or _first_day()
+    end = end or datetime.utcnow().date()
+    if start > end:
+        return 0
+
+    courses = _course_counts(start, end)
+    signups = _signup_counts(start, end)
+    course_rows = [{'day': date.fromisoformat(day), 'course_id': course_id,
+                    **{k: values.get(k) or 0 for k in ('active_students', 'lessons_completed', 'quiz_attempts',
+                                                        'quizzes_passed', 'submissions')}}
+                   for (day, course_id), values in courses.items()]
+    # Every day gets a signup row, even an empty one (see _first_day)
+    signup_rows = []
+    for offset in range((end - start).days + 1):
+        values = signups.get((start + timedelta(days=offset)).isoformat(), {})
+        signup_rows.append({'day': start + timedelta(days=offset), 'registrations': values.get('registrations', 0),
+                            'approvals': values.get('approvals', 0)})
+
+    db.session.execute(db.delete(DailyCourseStats).where(DailyCourseStats.day.between(start, end)))
+    db.session.execute(db.delete(DailySignupStats).where(DailySignupStats.day.between(start, end)))
+    if course_rows:
+        db.session.execute(db.insert(DailyCourseStats), course_rows)
+    db.session.execute(db.insert(DailySignupStats), signup_rows)
+    return len(course_rows) + len(signup_rows)
+
+
+def ensure_indexes():
+    """Create the timestamp indexes the rollup reads through on databases created before them.
+
+    Runs on the session's connection, so the indexes commit with the rollup.
+    """
+    for model, column in ((User, 'created_at'), (LessonProgress, 'completed_at'), (QuizResult, 'attempted_at'),
+                          (Submission, 'submitted_at')):
+        for index in model.__table__.indexes:
+            if [c.name for c in index.columns] == [column]:
+                index.create(db.session.connection(), checkfirst=True)
+
+
+@job('rollup_daily_stats', concurrency=1)
+def rollup_daily_stats(since=None):
+    ensure_indexes()
+    rows = rollup_days(date.fromisoformat(since) if since else None)
+    db.session.commit()
+    return {'rows': rows}
+
+
+@click.command('rollup-stats')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='First day to recompute (default: the last day already rolled up).')
+@with_appcontext
+def rollup_stats_command(since):
+    """Update the daily engagement rollups read by the admin analytics page."""
+    ensure_indexes()
+    rows = rollup_days(since.date() if since else None)
+    db.session.commit()
+    click.echo(f'Wrote {rows} daily rows.')
@@ -5,10 +5,19 @@ main = Blueprint('main', __name__)
 
 from app.models import Lesson, Course
 from app import db, bcrypt
+from app.versions import conditional, bump_version, enrolled_course_keys, lesson_course_key, quiz_result_course_key
+from app.queries import (enrolled_course_ids, load_courses, latest_quiz_results, user_submissions,
+                         completed_lesson_ids as completed_lessons_for)
+from app.leaderboard import (record_quiz_score, record_lesson_completion, record_grade_changes, top_scores, rank_of,
+                             participant_count)
+from app.resume import record_visit, resume_lessons
+from app.watch import record_position, reached_end
+from app import activity
 from flask import current_app
 from werkzeug.utils import secure_filename
 import os
 import json
+from functools import wraps
 
 @main.route('/')
 def index():
@@ -67,6 +76,7 @@ def student_dashboard():
         
     return render_template('student_dashboard.html', 
                            courses_data=enrolled_courses_data,
+                           resume=resume_lessons(current_user.id),
                            total_enrolled=total_enrolled,
                            avg_progress=avg_progress,
                            pending_assignments_count=pending_assignments_count)
@@ -81,11 +91,11 @@ def update_profile():
     if 'profile_image' in request.files:
         file = request.files['profile_image']
         if file and file.filename != '' and allowed_file(file.filename):
-            filename = secure_filename(f"avatar_{current_user.id}_{file.filename}")
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
             try:
-                file.save(file_path)
+                filename = store_upload(file)
+                release_upload(current_user.profile_image)
                 current_user.profile_image = filename
+                schedule_derivatives(filename)
                 flash('Profile image updated!', 'success')
             except Exception as e:
                 print(f"Error saving avatar: {e}")
@@ -120,6 +130,7 @@ def update_profile():
 
 @main.route('/course/<int:course_id>')
 @login_required
+@conditional(lambda course_id: [f'course:{course_id}', f'course:{course_id}:submissions', f'progress:{current_user.id}'])
 def course_view(course_id):
     course = Course.query.get_or_404(course_id)
     # Security check: Ensure user is enrolled
@@ -127,48 +138,41 @@ def course_view(course_id):
         flash('You are not enrolled in this course.', 'danger')
         return redirect(url_for('main.student_dashboard'))
     
-    # Get completed lessons for this user
-    from app.models import LessonProgress, QuizResult, Quiz
-    completed_progress = LessonProgress.query.filter_by(user_id=current_user.id, is_completed=True).all()
-    completed_lesson_ids = [p.lesson_id for p in completed_progress]
-    
-    # Check if quizzes are attempted
-    # Create a dictionary of quiz_id -> latest_result
-    quiz_results = {}
-    from app.models import QuizResult
-    results = QuizResult.query.filter_by(user_id=current_user.id).all()
-    for r in results:
-        # We want the latest one, so we can check if we already have one or use logic to keep latest
-        # Since we might have duplicates if we allowed re-takes, careful.
-        # But for the UI "Take Quiz" vs "View Score", we just need to know if ANY exists (or latest).
-        if r.quiz_id not in quiz_results:
-             quiz_results[r.quiz_id] = r
-        else:
-            # Overwrite if newer (assuming results are ordered or we compare dates)
-            if r.attempted_at > quiz_results[r.quiz_id].attempted_at:
-                quiz_results[r.quiz_id] = r
-                
-    # Fetch Assignment Submissions
-    # Create dict assignment_id -> submission
-    assignment_submissions = {}
-    from app.models import Submission
-    if current_user.role == 'student':
-        subs = Submission.query.filter_by(user_id=current_user.id).all()
-        for s in subs:
-            assignment_submissions[s.assignment_id] = s
+    # Completed lessons, latest quiz attempt per quiz and submissions: one query each
+    completed_lesson_ids = completed_lessons_for(current_user.id)
+    quiz_results = latest_quiz_results(current_user.id)
+    assignment_submissions = user_submissions(current_user.id) if current_user.role == 'student' else {}
 
     # Determine if it's a student view (for template logic)
     student_view = (current_user.role == 'student')
     
     return render_template('admin/course_content.html', course=course, modules=course.modules, student_view=student_view, completed_lesson_ids=completed_lesson_ids, quiz_results=quiz_results, submissions=assignment_submissions)
 
+@main.route('/course/<int:course_id>/leaderboard')
+@login_required
+@conditional(lambda course_id: [f'leaderboard:{course_id}'])
+def course_leaderboard(course_id):
+    course = Course.query.get_or_404(course_id)
+    if current_user.role != 'admin' and course not in current_user.enrolled_courses:
+        flash('You are not enrolled in this course.', 'danger')
+        return redirect(url_for('main.student_dashboard'))
+
+    # Top of the ranking plus the student's own position, both read from the score index
+    leaders = top_scores(course.id)
+    mine = rank_of(course.id, current_user.id) if current_user.role == 'student' else None
+    return render_template('leaderboard.html', course=course, leaders=leaders, mine=mine,
+                           participants=participant_count(course.id))
+
 @main.route('/quiz/<int:result_id>/result')
 @login_required
+@conditional(lambda result_id: [quiz_result_course_key(result_id)])
 def view_quiz_result(result_id):
-    from app.models import QuizResult, Quiz, Lesson
+    from app.models import QuizResult, QuizResultArchive, Quiz, Lesson
+    from app.quiz_archive import unpack_answers
     import json
     
-    result = QuizResult.query.get_or_404(result_id)
+    # Older attempts may have been moved to the archive (same id, packed answers)
+    result = db.session.get(QuizResult, result_id) or QuizResultArchive.query.get_or_404(result_id)
     if result.user_id != current_user.id:
         abort(403)
         
@@ -180,7 +184,9 @@ def view_quiz_result(result_id):
     
     # Parse stored answers
     stored_answers = {}
-    if result.answers:
+    if isinstance(result, QuizResultArchive):
+        stored_answers = unpack_answers(result.answers, sorted(q.id for q in quiz.questions), result.layout)
+    elif result.answers:
         try:
             stored_answers = json.loads(result.answers)
         except:
@@ -202,7 +208,8 @@ def view_quiz_result(result_id):
 @main.route('/admin/dashboard')
 @login_required
 def dashboard():
-    from app.models import User, Course, Quiz, Notification
+    from app.models import User, Course, Quiz
+    from app.notifications import unread_notifications
     
     # Stats
     total_students = User.query.filter_by(role='student').count()
@@ -211,7 +218,7 @@ def dashboard():
     total_courses = Course.query.count()
     
     # Notifications
-    notifications = Notification.query.filter_by(is_read=False).order_by(Notification.created_at.desc()).all()
+    notifications = unread_notifications(current_user.id)
     
 
     return render_template('admin/dashboard.html', 
@@ -226,16 +233,55 @@ def dashboard():
 @login_required
 def mark_notification_read(notification_id):
     from app.models import Notification
+    from app.notifications import mark_read
     if current_user.role != 'admin':
         return {'success': False}, 403
         
     notification = Notification.query.get_or_404(notification_id)
-    notification.is_read = True
+    mark_read(current_user.id, notification.id) # Only this admin's copy
     db.session.commit()
     return {'success': True}
 
+@main.route('/admin/notifications/read', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    from app.notifications import mark_all_read
+    if current_user.role != 'admin':
+        return {'success': False}, 403
+
+    # Up to the newest notification the page showed, as of its latest event, so ones that arrived
+    # since (new rows or events folded into a shown one) stay unread
+    from datetime import datetime
+    up_to = request.form.get('up_to', type=int)
+    try:
+        seen_at = datetime.fromisoformat(request.form['seen_at']) if request.form.get('seen_at') else None
+    except ValueError:
+        seen_at = None
+    if not up_to:
+        return {'success': False}, 400
+    mark_all_read(current_user.id, up_to, seen_at)
+    db.session.commit()
+    return {'success': True}
+
+def track_lesson_view(view):
+    """Log the view and move the student's resume pointer, also when @conditional answers with a 304.
+
+    Both run once the response exists, so the write transaction doesn't span the render.
+    """
+    @wraps(view)
+    def wrapper(lesson_id):
+        response = view(lesson_id=lesson_id)
+        activity.log_event(activity.LESSON_VIEW, lesson_id)
+        if current_user.role == 'student':
+            record_visit(current_user.id, lesson_id)
+            db.session.commit()
+        return response
+    return wrapper
+
 @main.route('/lesson/<int:lesson_id>')
 @login_required
+@track_lesson_view
+@conditional(lambda lesson_id: [lesson_course_key(lesson_id), f'progress:{current_user.id}'])
 def lesson_player(lesson_id):
     lesson = Lesson.query.get_or_404(lesson_id)
     
@@ -278,26 +324,92 @@ def lesson_player(lesson_id):
 @login_required
 def mark_complete(lesson_id):
     from app import db
-    from app.models import LessonProgress
-    from datetime import datetime
-    
-    lesson = Lesson.query.get_or_404(lesson_id)
     
-    # Check existing progress
-    progress = LessonProgress.query.filter_by(user_id=current_user.id, lesson_id=lesson.id).first()
-    
-    if not progress:
-        progress = LessonProgress(user_id=current_user.id, lesson_id=lesson.id, is_completed=True, completed_at=datetime.utcnow())
-        db.session.add(progress)
-    else:
-        progress.is_completed = not progress.is_completed # Toggle
-        progress.completed_at = datetime.utcnow() if progress.is_completed else None
-        
-    db.session.commit()
+    # The module is needed for the leaderboard and the course's progress version
+    lesson = Lesson.query.options(db.joinedload(Lesson.module)).get_or_404(lesson_id)
+    set_lesson_completed(lesson) # Toggle
     
     flash('Lesson status updated.', 'success')
     return redirect(url_for('main.lesson_player', lesson_id=lesson.id))
 
+def set_lesson_completed(lesson, completed=None):
+    # Shared by mark_complete (toggle, completed=None) and the video heartbeat (completed=True).
+    # One upsert on (user_id, lesson_id) writes the progress row and returns its new state, so
+    # there is no read first and a double click can't create a second row. Returns the new state,
+    # or None when the row already had it.
+    from app.models import LessonProgress
+    from sqlalchemy.dialects.sqlite import insert
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    was_completed = db.func.coalesce(LessonProgress.is_completed, False)
+    stmt = insert(LessonProgress).values(user_id=current_user.id, lesson_id=lesson.id,
+                                         is_completed=completed is not False,
+                                         completed_at=now if completed is not False else None)
+    if completed is None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'lesson_id'],
+            set_={'is_completed': db.not_(was_completed),
+                  'completed_at': db.case((was_completed, None), else_=now)})
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'lesson_id'],
+            set_={'is_completed': stmt.excluded.is_completed, 'completed_at': stmt.excluded.completed_at},
+            where=was_completed != completed)
+    completed = db.session.execute(stmt.returning(LessonProgress.is_completed)).scalar()
+    if completed is None:
+        return None
+    # Core statements bypass the flush hooks that bump these
+    bump_version(f'progress:{current_user.id}', f'course:{lesson.module.course_id}:progress')
+
+    record_lesson_completion(current_user.id, lesson, completed)
+    if current_user.role == 'student':
+        record_visit(current_user.id, lesson.id, completed)
+    db.session.commit()
+    activity.log_event(activity.LESSON_COMPLETE if completed else activity.LESSON_UNCOMPLETE, lesson.id)
+    return completed
+
+@main.route('/lesson/<int:lesson_id>/heartbeat', methods=['POST'])
+@login_required
+def video_heartbeat(lesson_id):
+    # Sent by the player every WATCH_HEARTBEAT_SECONDS while the video plays. The position is
+    # only buffered (see app.watch); the database is written once the end of the video is reached.
+    from flask import jsonify
+    from math import isfinite
+    from app.models import Module, enrollments
+
+    data = request.get_json(silent=True) or request.form
+    try:
+        position = float(data.get('position'))
+        duration = float(data['duration']) if data.get('duration') else None
+    except (TypeError, ValueError):
+        abort(400)
+    if not isfinite(position) or position < 0 or (duration is not None and (not isfinite(duration) or duration <= 0)):
+        abort(400)
+    if current_user.role != 'student':
+        return jsonify(completed=False)
+
+    # Only video lessons of the student's own courses, checked with one query before anything is buffered
+    video_url = db.session.execute(
+        db.select(Lesson.video_url)
+        .join(Module, Lesson.module_id == Module.id)
+        .join(enrollments, db.and_(enrollments.c.course_id == Module.course_id,
+                                   enrollments.c.user_id == current_user.id))
+        .where(Lesson.id == lesson_id)
+    ).first()
+    if video_url is None:
+        abort(404)
+    if not video_url[0]:
+        abort(400)
+
+    record_position(current_user.id, lesson_id, position, duration)
+    completed = str(data.get('completed')).lower() == 'true' # The page already shows the lesson as complete
+    if not completed and reached_end(position, duration):
+        lesson = Lesson.query.options(db.joinedload(Lesson.module)).get_or_404(lesson_id)
+        set_lesson_completed(lesson, True) # No-op if it already was
+        completed = True
+    return jsonify(completed=completed)
+
 @main.route('/admin/submission/<int:submission_id>/reject', methods=['POST'])
 @login_required
 def reject_assignment(submission_id):
@@ -311,11 +423,9 @@ def reject_assignment(submission_id):
     submission = Submission.query.get_or_404(submission_id)
     lesson_id = submission.assignment.lesson_id
     
-    # Delete the submission file from the server
-    if submission.file_path:
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], submission.file_path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    # Release the submission file (removed from the server once nothing else references it)
+    release_upload(submission.file_path)
+    record_grade_changes(submission.assignment.lesson.module.course_id, [(submission.user_id, submission.grade, None)])
             
     # Delete the submission record from the database
     db.session.delete(submission)
@@ -341,13 +451,15 @@ def student_assignments():
         return redirect(url_for('main.index'))
         
     assignments_data = []
+    courses = load_courses(enrolled_course_ids(current_user.id))
+    submissions = user_submissions(current_user.id)
     
     # Iterate through enrolled courses to find all assignments
-    for course in current_user.enrolled_courses:
+    for course in courses:
         for module in course.modules:
             for lesson in module.lessons:
                 if lesson.assignment:
-                    submission = Submission.query.filter_by(user_id=current_user.id, assignment_id=lesson.assignment.id).first()
+                    submission = submissions.get(lesson.assignment.id)
                     assignments_data.append({
                         'course': course,
                         'lesson': lesson,
@@ -370,6 +482,7 @@ def take_quiz(lesson_id):
     if not quiz:
         flash('No quiz available for this lesson.', 'warning')
         return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
+    activity.log_event(activity.QUIZ_START, quiz.id)
     
     # Parse options for template
     questions_data = []
@@ -408,10 +521,12 @@ def submit_quiz(lesson_id):
         if selected:
             answers_dict[str(q.id)] = int(selected)
             
-    # Save result
+    # Save result (leaderboard first: it compares with the best earlier attempt)
+    record_quiz_score(current_user.id, quiz, percentage)
     result = QuizResult(user_id=current_user.id, quiz_id=quiz.id, score=percentage, passed=passed, answers=json.dumps(answers_dict))
     db.session.add(result)
     db.session.commit()
+    activity.log_event(activity.QUIZ_SUBMIT, result.id)
     
     # Prepare questions data for Answer Key
     questions_data = []
@@ -428,21 +543,22 @@ def submit_quiz(lesson_id):
 
 @main.route('/student/quizzes')
 @login_required
+@conditional(lambda: enrolled_course_keys(current_user.id) + [f'progress:{current_user.id}'])
 def student_quizzes():
     if current_user.role != 'student':
         return redirect(url_for('main.index'))
         
+    courses = load_courses(enrolled_course_ids(current_user.id))
+    results = latest_quiz_results(current_user.id)
     enrolled_quizzes = []
-    for course in current_user.enrolled_courses:
+    for course in courses:
         for module in course.modules:
             for lesson in module.lessons:
                 if lesson.quiz:
-                    # Check if attempted
-                    result = QuizResult.query.filter_by(user_id=current_user.id, quiz_id=lesson.quiz.id).order_by(QuizResult.attempted_at.desc()).first()
                     enrolled_quizzes.append({
                         'quiz': lesson.quiz,
                         'course': course,
-                        'result': result
+                        'result': results.get(lesson.quiz.id)
                     })
                     
     return render_template('student_quizzes.html', quizzes=enrolled_quizzes)
@@ -452,6 +568,9 @@ from app.models import Assignment, Submission
 from werkzeug.utils import secure_filename
 import os
 from flask import send_file, current_app, abort
+from app.storage import store_upload, release_upload, download_name
+from app.images import schedule_derivatives
+from app.jobs import job, enqueue
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'zip', 'doc', 'docx'}
 
@@ -462,76 +581,104 @@ def allowed_file(filename):
 @main.route('/lesson/<int:lesson_id>/assignment/upload', methods=['POST'])
 @login_required
 def upload_assignment(lesson_id):
-    print(f"DEBUG: Upload started for lesson {lesson_id}")
-    lesson = Lesson.query.get_or_404(lesson_id)
+    lesson = Lesson.query.options(db.joinedload(Lesson.module)).get_or_404(lesson_id)
     assignment = Assignment.query.filter_by(lesson_id=lesson_id).first_or_404()
     
     if 'file' not in request.files:
-        print("DEBUG: No 'file' key in request.files")
         flash('No file part', 'danger')
         return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
         
     file = request.files['file']
-    print(f"DEBUG: File uploaded: {file.filename}")
     
     if file.filename == '':
-        print("DEBUG: Filename is empty")
         flash('No selected file', 'danger')
         return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
         
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"{current_user.id}_{assignment.id}_{file.filename}")
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        print(f"DEBUG: Saving file to {file_path}")
         try:
-            file.save(file_path)
-        except Exception as e:
-            print(f"DEBUG: File save error: {e}")
+            filename = store_upload(file)
+        except Exception:
+            current_app.logger.exception('Could not store assignment upload for lesson %s', lesson_id)
             flash('Error saving file.', 'danger')
             return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
         
-        # Check if updating existing submission
-        submission = Submission.query.filter_by(user_id=current_user.id, assignment_id=assignment.id).first()
+        from sqlalchemy.dialects.sqlite import insert
+        from datetime import datetime
         
-        if submission:
+        # First submission: a single INSERT. The unique (user_id, assignment_id) constraint turns a
+        # resubmission (or a double click) into a conflict, handled below.
+        now = datetime.utcnow()
+        submitted = db.session.execute(
+            insert(Submission).values(user_id=current_user.id, assignment_id=assignment.id, file_path=filename,
+                                      submitted_at=now)
+            .on_conflict_do_nothing(index_elements=['user_id', 'assignment_id'])
+            .returning(Submission.id)
+        ).scalar()
+        resubmitted = submitted is None
+        
+        if resubmitted:
+            previous = db.session.execute(
+                db.select(Submission.file_path, Submission.grade)
+                .where(Submission.user_id == current_user.id, Submission.assignment_id == assignment.id)
+            ).one()
             # Prevent resubmission if graded
-            if submission.grade is not None:
-                 print("DEBUG: Attempt to resubmit graded assignment blocked")
+            if previous.grade is not None:
+                 db.session.rollback()
                  flash('Cannot resubmit. Assignment has already been graded.', 'warning')
                  return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
+            
+            # Only replace the file read above, so a concurrent resubmission can't release it twice
+            submitted = db.session.execute(
+                db.update(Submission)
+                .where(Submission.user_id == current_user.id, Submission.assignment_id == assignment.id,
+                       Submission.file_path == previous.file_path, Submission.grade.is_(None))
+                .values(file_path=filename, submitted_at=now)
+                .returning(Submission.id)
+            ).scalar()
+            if submitted is None:
+                db.session.rollback()
+                flash('Your submission changed in the meantime. Please upload again.', 'warning')
+                return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
+            release_upload(previous.file_path)
+        
+        # Core statements bypass the flush hooks that bump these
+        bump_version(f'progress:{current_user.id}', f'course:{lesson.module.course_id}:submissions')
 
-            submission.file_path = filename 
-            from datetime import datetime
-            submission.submitted_at = datetime.utcnow()
-            print("DEBUG: Updated existing submission")
-        else:
-            submission = Submission(
-                user_id=current_user.id,
-                assignment_id=assignment.id,
-                file_path=filename
-            )
-            db.session.add(submission)
-            print("DEBUG: Created new submission")
-
-        # Create Admin Notification
-        from app.models import Notification
-        course_title = lesson.module.course.title
-        msg = f"Submission in {course_title}: {lesson.title} by {current_user.full_name}"
-        notification = Notification(
-            message=msg,
-            link=url_for('admin_bp.assignment_submissions', assignment_id=assignment.id)
-        )
-        db.session.add(notification)
+        # Create Admin Notification (on the job worker, committed together with the submission)
+        enqueue('notify_submission',
+                lesson_id=lesson.id,
+                student_id=current_user.id,
+                link=url_for('admin_bp.assignment_submissions', assignment_id=assignment.id),
+                resubmitted=resubmitted)
             
         db.session.commit()
         flash('Assignment submitted successfully!', 'success')
         
     else:
-        print(f"DEBUG: Invalid file type: {file.filename}")
         flash('Invalid file type. Allowed: pdf, doc, zip, images', 'danger')
         
     return redirect(url_for('main.lesson_player', lesson_id=lesson_id))
 
+@job('notify_submission')
+def notify_submission(lesson_id, student_id, link, resubmitted=False):
+    from app.models import User
+    from app.notifications import notify
+    lesson = Lesson.query.get(lesson_id)
+    student = User.query.get(student_id)
+    if not lesson or not student:
+        return None
+    course_title = lesson.module.course.title
+    # Uploads to one assignment add up in a single entry until an admin reads it; replaced files
+    # are counted apart, so "new submissions" is the number of new submissions
+    if resubmitted:
+        msg = f"Resubmission in {course_title}: {lesson.title} by {student.full_name}"
+        notify(msg, link=link, group_key=f'resubmissions:{lesson.id}',
+               group_message=f"{{count}} resubmissions in {course_title}: {lesson.title}")
+    else:
+        msg = f"Submission in {course_title}: {lesson.title} by {student.full_name}"
+        notify(msg, link=link, group_key=f'submissions:{lesson.id}',
+               group_message=f"{{count}} new submissions in {course_title}: {lesson.title}")
+
 @main.route('/submission/<int:submission_id>/download')
 @login_required
 def download_submission(submission_id):
@@ -543,7 +690,8 @@ def download_submission(submission_id):
         
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], submission.file_path)
     if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True)
+        activity.log_event(activity.SUBMISSION_DOWNLOAD, submission.id)
+        return send_file(file_path, as_attachment=True, download_name=download_name(submission.file_path))
     else:
         flash('File not found at path: ' + file_path, 'danger')
         return redirect(url_for('main.index'))
@@ -568,7 +716,8 @@ def download_assignment_resource(assignment_id):
         
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], assignment.resource_path)
     if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True)
+        activity.log_event(activity.RESOURCE_DOWNLOAD, assignment.id)
+        return send_file(file_path, as_attachment=True, download_name=download_name(assignment.resource_path))
     else:
         flash('Resource file not found.', 'danger')
         return redirect(request.referrer or url_for('main.index'))
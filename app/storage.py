@@ -0,0 +1,316 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.models import UploadBlob, Assignment, Submission, User, Course
+from app.images import derivative_files, is_image
+from app.jobs import job, enqueue
+from app.metrics import record_upload
+
+# Uploads are stored by SHA-256 under blobs/<aa>/<bb>/<digest><ext>, so identical
+# files are written once no matter how many assignments, submissions or avatars use them.
+BLOB_DIR = 'blobs'
+TMP_DIR = '.tmp'
+QUARANTINE_DIR = '.quarantine'
+CHUNK_SIZE = 64 * 1024
+
+# Paths that are not uploads and must never be released
+RESERVED_PATHS = {'default_avatar.png'}
+
+# Columns that hold paths relative to UPLOAD_FOLDER
+UPLOAD_REFERENCES = [
+    (Assignment, 'resource_path'),
+    (Submission, 'file_path'),
+    (User, 'profile_image'),
+    (Course, 'thumbnail_url'),
+]
+
+
+def upload_root():
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def blob_path(digest, filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_blob(path):
+    return bool(path) and path.startswith(BLOB_DIR + '/')
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def store_upload(file, filename=None):
+    """Save an uploaded FileStorage and return its path relative to UPLOAD_FOLDER.
+
+    The file is hashed while it is streamed to a temp file; if a blob with the same
+    digest already exists the temp file is dropped and only the reference count grows.
+    """
+    filename = filename or file.filename
+    tmp_dir = os.path.join(upload_root(), TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    record_upload(size)
+    return ingest_file(tmp_path, sha.hexdigest(), size, filename)
+
+
+def ingest_file(src_path, digest, size, filename, ref_delta=1):
+    """Move src_path into the blob store (or discard it if the blob exists) and count a reference."""
+    rel_path = blob_path(digest, filename)
+    dest = os.path.join(upload_root(), rel_path)
+
+    existing = db.session.get(UploadBlob, digest)
+    if existing is not None:
+        rel_path = existing.path
+        dest = os.path.join(upload_root(), rel_path)
+
+    if os.path.exists(dest):
+        os.remove(src_path)
+    else:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+
+    # Single statement so concurrent uploads of the same file both count
+    stmt = insert(UploadBlob).values(
+        sha256=digest,
+        path=rel_path,
+        original_name=secure_filename(filename or '') or None,
+        size=size,
+        ref_count=ref_delta,
+        created_at=datetime.utcnow(),
+    ).on_conflict_do_update(
+        index_elements=['sha256'],
+        set_={'ref_count': UploadBlob.ref_count + ref_delta},
+    )
+    db.session.execute(stmt)
+    return rel_path
+
+
+def retain_upload(path):
+    """Count an extra reference to an existing upload path."""
+    if is_blob(path):
+        db.session.execute(
+            db.update(UploadBlob)
+            .where(UploadBlob.path == path)
+            .values(ref_count=UploadBlob.ref_count + 1)
+        )
+
+
+def release_upload(path):
+    """Drop one reference to an upload; a background job removes the file once the last reference is committed away."""
+    if not path or path in RESERVED_PATHS or path.startswith('http'):
+        return
+
+    if is_blob(path):
+        blob = UploadBlob.query.filter_by(path=path).first()
+        if blob is None:
+            return
+        db.session.execute(
+            db.update(UploadBlob)
+            .where(UploadBlob.sha256 == blob.sha256)
+            .values(ref_count=UploadBlob.ref_count - 1)
+        )
+        db.session.refresh(blob)
+        if blob.ref_count > 0:
+            return
+        db.session.delete(blob)
+
+    # Legacy flat uploads belong to a single row, so they can go straight away
+    db.session.info.setdefault('pending_upload_deletes', []).append(path)
+
+
+def download_name(path):
+    """Human-readable name for a stored upload."""
+    if is_blob(path):
+        blob = UploadBlob.query.filter_by(path=path).first()
+        if blob and blob.original_name:
+            return blob.original_name
+    return os.path.basename(path)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _queue_released_files(session):
+    # One durable job per transaction; it only exists if the release itself commits
+    paths = session.info.pop('pending_upload_deletes', None)
+    if paths:
+        enqueue('delete_upload_files', paths=paths)
+
+
+@job('delete_upload_files')
+def delete_upload_files(paths):
+    deleted = 0
+    for path in paths:
+        if is_blob(path) and UploadBlob.query.filter_by(path=path).first():
+            continue # Uploaded again since it was released
+        try:
+            os.remove(os.path.join(upload_root(), path))
+            deleted += 1
+        except FileNotFoundError:
+            pass
+    return {'deleted': deleted}
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_released_files(session, previous_transaction):
+    session.info.pop('pending_upload_deletes', None)
+
+
+# --- Garbage collection ---
+
+def referenced_paths():
+    """Stream every upload path the database still points at (plus image derivatives) into a set."""
+    root = upload_root()
+    paths = set()
+    for model, column in UPLOAD_REFERENCES:
+        col = getattr(model, column)
+        result = db.session.execute(
+            db.select(col).where(col.isnot(None)).execution_options(yield_per=1000)
+        )
+        for (path,) in result:
+            if not path.startswith('http'):
+                paths.add(path)
+                if is_image(path):
+                    paths.update(derivative_files(root, path))
+    return paths
+
+
+def _scan_files(root, skip_dirs):
+    # Iterative os.scandir walk yielding (path relative to root, DirEntry)
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            entries = list(os.scandir(os.path.join(root, rel_dir)))
+        except FileNotFoundError:
+            continue # Removed while the walk was in progress
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if rel not in skip_dirs:
+                    stack.append(rel)
+            elif entry.is_file(follow_symlinks=False):
+                yield rel, entry
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _remove_empty_dirs(path, stop):
+    while path != stop:
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+
+def collect_garbage(grace_seconds=86400, batch_size=500, dry_run=False):
+    """Quarantine unreferenced uploads, then delete quarantined files once the grace period has passed.
+
+    Files are moved to .quarantine/ first so that a reference added by an in-flight request
+    (or a bad run) can still be restored; they are only deleted on a later run.
+    Returns a dict of counters.
+    """
+    root = upload_root()
+    quarantine_root = os.path.join(root, QUARANTINE_DIR)
+    referenced = referenced_paths()
+    cutoff = time.time() - grace_seconds
+    stats = {'scanned': 0, 'quarantined': 0, 'restored': 0, 'deleted': 0}
+
+    # 1. Move unreferenced files that are older than the grace period into quarantine
+    files = _scan_files(root, skip_dirs={QUARANTINE_DIR})
+    for batch in _batched(files, batch_size):
+        for rel, entry in batch:
+            stats['scanned'] += 1
+            if rel in referenced or rel in RESERVED_PATHS:
+                continue
+            if entry.stat().st_mtime > cutoff:
+                continue # Possibly an upload whose transaction has not committed yet
+            stats['quarantined'] += 1
+            if dry_run:
+                continue
+            dest = os.path.join(quarantine_root, rel)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(entry.path, dest)
+            os.utime(dest) # Quarantine clock starts now
+            _remove_empty_dirs(os.path.dirname(entry.path), root)
+
+    if not os.path.isdir(quarantine_root):
+        return stats
+
+    # 2. Restore quarantined files that became referenced again, delete the expired rest
+    for batch in _batched(_scan_files(quarantine_root, skip_dirs=set()), batch_size):
+        for rel, entry in batch:
+            if rel in referenced:
+                stats['restored'] += 1
+                if not dry_run:
+                    dest = os.path.join(root, rel)
+                    if os.path.exists(dest):
+                        os.remove(entry.path)
+                    else:
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        shutil.move(entry.path, dest)
+            elif entry.stat().st_mtime < cutoff:
+                stats['deleted'] += 1
+                if not dry_run:
+                    os.remove(entry.path)
+                    if is_blob(rel):
+                        UploadBlob.query.filter_by(path=rel, ref_count=0).delete()
+            _remove_empty_dirs(os.path.dirname(entry.path), quarantine_root)
+        if not dry_run:
+            db.session.commit()
+
+    return stats
+
+
+@click.command('gc-uploads')
+@click.option('--grace-hours', default=24, show_default=True, help='Minimum age before a file is quarantined or deleted.')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Only report what would be done.')
+@with_appcontext
+def gc_uploads_command(grace_hours, batch_size, dry_run):
+    """Quarantine and delete upload files no longer referenced by the database."""
+    stats = collect_garbage(grace_seconds=grace_hours * 3600, batch_size=batch_size, dry_run=dry_run)
+    click.echo(
+        f"Scanned {stats['scanned']} files: {stats['quarantined']} quarantined, "
+        f"{stats['restored']} restored, {stats['deleted']} deleted."
+    )
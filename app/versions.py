@@ -0,0 +1,184 @@
+import hashlib
+import os
+from functools import wraps
+
+from flask import g, has_app_context, request, session, make_response, current_app
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import (DataVersion, Course, Module, Lesson, Quiz, Question, Assignment,
+                        Submission, LessonProgress, QuizResult, QuizResultArchive, User)
+
+# Version keys:
+#   course:<id>              course structure (modules, lessons, quizzes, questions, assignments)
+#   course:<id>:submissions  submissions and grades for the course's assignments
+#   course:<id>:progress     lesson progress of every student in the course
+#   progress:<user_id>       one student's lesson progress, quiz results and submissions
+#   courses                  the course catalog (titles, thumbnails, deletions)
+#   students                 student accounts, statuses and enrollments
+#   user:<id>                one account (profile, status, enrollments)
+#   leaderboard:<course_id>  leaderboard points of the course (bumped by app.leaderboard)
+#   resume:<user_id>         one student's resume pointers (bumped by app.resume)
+
+
+def get_versions(*keys):
+    """Current counters for the given keys (0 for keys never bumped), memoized for the request."""
+    cache = g.setdefault('data_versions', {})
+    missing = [k for k in keys if k not in cache]
+    if missing:
+        cache.update({k: 0 for k in missing})
+        rows = DataVersion.query.filter(DataVersion.key.in_(missing)).all()
+        cache.update({row.key: row.version for row in rows})
+    return {k: cache[k] for k in keys}
+
+
+def data_version(*keys):
+    """Combined version string for cache keys, e.g. data_version('course:1', 'progress:4') -> '7.2'."""
+    versions = get_versions(*keys)
+    return '.'.join(str(versions[k]) for k in keys)
+
+
+def bump_version(*keys):
+    """Increment counters in the current transaction (for changes the flush hooks cannot see)."""
+    _increment(db.session.connection(), *keys)
+
+
+def _increment(connection, *keys):
+    if not keys:
+        return
+    connection.execute(
+        insert(DataVersion).on_conflict_do_update(
+            index_elements=['key'], set_={'version': DataVersion.version + 1}
+        ),
+        [{'key': key, 'version': 1} for key in sorted(set(keys))],
+    )
+    if has_app_context():
+        g.pop('data_versions', None)
+
+
+def _course_id_of_module(session, module_id):
+    module = session.get(Module, module_id) if module_id else None
+    return module.course_id if module else None
+
+
+def _course_id_of_lesson(session, lesson_id):
+    lesson = session.get(Lesson, lesson_id) if lesson_id else None
+    return _course_id_of_module(session, lesson.module_id) if lesson else None
+
+
+def _course_id_of_assignment(session, assignment_id):
+    assignment = session.get(Assignment, assignment_id) if assignment_id else None
+    return _course_id_of_lesson(session, assignment.lesson_id) if assignment else None
+
+
+def _keys_for(session, obj):
+    if isinstance(obj, Course):
+        return ['courses', f'course:{obj.id}'] if obj.id else ['courses']
+    if isinstance(obj, Module):
+        return [f'course:{obj.course_id}']
+    if isinstance(obj, Lesson):
+        return [f'course:{_course_id_of_module(session, obj.module_id)}']
+    if isinstance(obj, (Quiz, Assignment)):
+        return [f'course:{_course_id_of_lesson(session, obj.lesson_id)}']
+    if isinstance(obj, Question):
+        quiz = session.get(Quiz, obj.quiz_id) if obj.quiz_id else None
+        return [f'course:{_course_id_of_lesson(session, quiz.lesson_id)}'] if quiz else []
+    if isinstance(obj, Submission):
+        return [f'progress:{obj.user_id}',
+                f'course:{_course_id_of_assignment(session, obj.assignment_id)}:submissions']
+    if isinstance(obj, LessonProgress):
+        return [f'progress:{obj.user_id}', f'course:{_course_id_of_lesson(session, obj.lesson_id)}:progress']
+    if isinstance(obj, QuizResult):
+        return [f'progress:{obj.user_id}']
+    if isinstance(obj, User):
+        return ['students', f'user:{obj.id}'] if obj.id else ['students']
+    return []
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_changed_versions(session, flush_context, instances):
+    keys = session.info.setdefault('bumped_versions', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        keys.update(k for k in _keys_for(session, obj) if 'None' not in k)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_changed_versions(session, flush_context):
+    keys = session.info.pop('bumped_versions', None)
+    if not keys:
+        return
+    _increment(session.connection(), *keys)
+
+
+# --- Conditional GET ---
+
+def _code_salt():
+    # Changes whenever templates or code are deployed, so old ETags stop matching
+    root = os.path.dirname(__file__)
+    latest = 0
+    for dirpath, _, filenames in os.walk(root):
+        if 'static' in dirpath.split(os.sep):
+            continue
+        for name in filenames:
+            if name.endswith(('.py', '.html')):
+                latest = max(latest, os.path.getmtime(os.path.join(dirpath, name)))
+    return str(latest)
+
+
+CODE_SALT = _code_salt()
+
+
+def enrolled_course_keys(user_id):
+    from app.models import enrollments
+    rows = db.session.execute(
+        db.select(enrollments.c.course_id).where(enrollments.c.user_id == user_id)
+    )
+    return [f'course:{course_id}' for (course_id,) in rows]
+
+
+def lesson_course_key(lesson_id):
+    return f'course:{_course_id_of_lesson(db.session, lesson_id)}'
+
+
+def quiz_result_course_key(result_id):
+    result = db.session.get(QuizResult, result_id) or db.session.get(QuizResultArchive, result_id)
+    quiz = db.session.get(Quiz, result.quiz_id) if result else None
+    return lesson_course_key(quiz.lesson_id) if quiz else 'course:None'
+
+
+def conditional(keys_fn):
+    """Answer GETs with 304 when none of the data versions a view depends on changed.
+
+    keys_fn receives the view's URL arguments and returns the version keys the page is built
+    from; the current user's own key is always included. The weak ETag is derived from the
+    URL, the user and those counters, so it is checked before the view runs any heavy query.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pending flash messages would be lost on a cached page
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            keys = [f'user:{current_user.id}'] + [k for k in keys_fn(**kwargs) if 'None' not in k]
+            versions = get_versions(*keys)
+            raw = '|'.join([CODE_SALT, request.full_path, str(current_user.id)] +
+                           [f'{k}={versions[k]}' for k in keys])
+            tag = hashlib.sha1(raw.encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(tag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,99 @@
+import os
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+
+from app import db
+from app.activity import EventBuffer
+from app.models import VideoProgress
+
+# Video watch progress. The lesson player posts a heartbeat with its position every
+# WATCH_HEARTBEAT_SECONDS; record_position() only overwrites the pending entry of that student
+# and lesson in memory (last write wins), and the flusher thread writes whatever is pending every
+# WATCH_FLUSH_SECONDS with one executemany upsert in one transaction. However many viewers are
+# playing, the database sees one write per student and lesson per interval and one commit per
+# process. Workers may each hold a position for the same video; the newest one wins.
+
+_UPSERT = insert(VideoProgress.__table__)
+_UPSERT = _UPSERT.on_conflict_do_update(
+    index_elements=['user_id', 'lesson_id'],
+    set_={'position': _UPSERT.excluded.position,
+          'furthest': db.func.max(VideoProgress.furthest, _UPSERT.excluded.furthest),
+          'duration': db.func.coalesce(_UPSERT.excluded.duration, VideoProgress.duration),
+          'updated_at': _UPSERT.excluded.updated_at},
+    where=VideoProgress.updated_at <= _UPSERT.excluded.updated_at,
+)
+
+
+class PositionBuffer(EventBuffer):
+    """EventBuffer keyed by (user_id, lesson_id): a newer position replaces the pending one.
+
+    Its size is bounded by the number of viewers, so it is flushed on the interval only.
+    """
+
+    def add(self, position):
+        key = (position['user_id'], position['lesson_id'])
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            pending = self._events.get(key)
+            if pending is None and len(self._events) >= self.max_pending:
+                self.dropped += 1
+                return
+            if pending is not None:
+                position['furthest'] = max(position['furthest'], pending['furthest'])
+            self._events[key] = position
+
+    def flush(self):
+        """Write every pending position; returns the number of rows written."""
+        with self._lock:
+            positions, self._events = self._events, {}
+        if not positions:
+            return 0
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(_UPSERT, list(positions.values()))
+        except IntegrityError:
+            # A bad row fails the whole batch and would again on every retry
+            self.app.logger.exception('Dropped %d video positions that could not be written', len(positions))
+            return 0
+        except SQLAlchemyError:
+            self.app.logger.exception('Could not write %d video positions', len(positions))
+            with self._lock:
+                for key, position in positions.items():
+                    if len(self._events) >= self.max_pending:
+                        break
+                    self._events.setdefault(key, position) # Newer heartbeats since the swap win
+            return 0
+        return len(positions)
+
+    def _start(self):
+        super()._start()
+        self._events = {}
+
+
+def record_position(user_id, lesson_id, position, duration=None):
+    """Queue a heartbeat without touching the database."""
+    buffer = current_app.extensions.get('watch')
+    if buffer is None:
+        return
+    buffer.add({'user_id': user_id, 'lesson_id': lesson_id, 'position': position, 'furthest': position,
+                'duration': duration, 'updated_at': datetime.utcnow()})
+
+
+def flush_positions(app=None):
+    buffer = (app or current_app).extensions.get('watch')
+    return buffer.flush() if buffer else 0
+
+
+def reached_end(position, duration):
+    """Whether a heartbeat at position is far enough into the video to complete the lesson."""
+    return bool(duration) and position >= duration * current_app.config.get('WATCH_COMPLETE_RATIO', 0.9)
+
+
+def init_watch(app):
+    app.extensions['watch'] = PositionBuffer(app, None, app.config.get('WATCH_FLUSH_SECONDS', 10.0),
+                                             app.config.get('WATCH_MAX_PENDING', 100000))
@@ -0,0 +1,38 @@
+"""Synthetic data and load benchmarks.
+
+    python -m benchmarks.datagen --users 2000 --courses 20
+    python -m benchmarks.loadtest --concurrency 8 --iterations 20 --out bench.json
+    python -m benchmarks.loadtest --gunicorn 4 --out bench-gunicorn.json
+    python -m pytest benchmarks/test_query_budgets.py     # or: python -m benchmarks.query_budgets
+
+Both use their own database (instance/bench.db) and upload folder (instance/bench_uploads)
+unless DATABASE_URL / UPLOAD_FOLDER are set, so they never touch the development data. The
+query-budget check builds its own budget_small.db and budget_large.db: in a temporary directory
+under pytest, in instance/ when run as a module.
+"""
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_PASSWORD = 'bench-pass'
+
+
+def bench_env():
+    """Environment for the app under benchmark (also passed to gunicorn)."""
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///bench.db')
+    env.setdefault('UPLOAD_FOLDER', os.path.join(ROOT, 'instance', 'bench_uploads'))
+    env.setdefault('QUERY_STATS_HEADERS', '1')
+    env.setdefault('PROFILE_SAMPLE_RATE', '0')
+    return env
+
+
+def bench_app():
+    os.environ.update(bench_env())
+    from app import create_app
+    app = create_app()
+    app.config['QUERY_STATS_HEADERS'] = True
+    return app
+
+
+def student_email(index):
+    return f'student{index}@bench.local'
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from benchmarks import bench_app, student_email, BENCH_PASSWORD
+
+CHUNK = 5000
+
+
+def _bulk(db, target, rows):
+    """Insert rows with executemany in chunks; target is a model or a Table."""
+    from sqlalchemy import insert
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(target), rows[i:i + CHUNK])
+
+
+def generate(app, users=500, courses=10, modules=4, lessons=5, quiz_every=2, questions=5, assignment_every=3,
+             enrollments_per_user=3, attempts=2, submission_rate=0.5, progress_rate=0.4, files=50, file_kb=64,
+             seed=42):
+    """Rebuild the database with a deterministic synthetic dataset and return row counts.
+
+    Ids are assigned here rather than by the database so related rows can be built without
+    reading anything back; every table is written with a handful of executemany calls.
+    """
+    from app import db, bcrypt
+    from app.models import (User, Category, Course, Module, Lesson, Quiz, Question, Assignment, QuizResult,
+                            Submission, LessonProgress, UploadBlob, enrollments)
+    from app.storage import blob_path
+    from app.leaderboard import rebuild_scores
+
+    rng = random.Random(seed)
+    base_time = datetime(2024, 1, 1)
+    counts = {}
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        upload_root = app.config['UPLOAD_FOLDER']
+        shutil.rmtree(upload_root, ignore_errors=True)
+        os.makedirs(upload_root, exist_ok=True)
+
+        # One bcrypt hash shared by every account keeps generation fast
+        password_hash = bcrypt.generate_password_hash(BENCH_PASSWORD).decode('utf-8')
+        user_rows = [dict(id=1, full_name='Bench Admin', email='admin@bench.local', password_hash=password_hash,
+                          role='admin', status='approved', created_at=base_time)]
+        user_rows += [dict(id=i + 2, full_name=f'Student {i:05d}', email=student_email(i), password_hash=password_hash,
+                           role='student', status='approved', created_at=base_time + timedelta(minutes=i))
+                      for i in range(users)]
+        _bulk(db, User, user_rows)
+        student_ids = [row['id'] for row in user_rows[1:]]
+
+        _bulk(db, Category, [dict(id=i + 1, name=f'Category {i + 1}') for i in range(3)])
+
+        course_rows, module_rows, lesson_rows, quiz_rows, question_rows, assignment_rows = [], [], [], [], [], []
+        course_lessons = {} # course_id -> [lesson_id]
+        course_quizzes = {} # course_id -> [(quiz_id, [(question_id, correct_option)])]
+        course_assignments = {} # course_id -> [assignment_id]
+        for c in range(courses):
+            course_id = c + 1
+            course_rows.append(dict(id=course_id, title=f'Course {course_id}', description=f'Synthetic course {course_id}.',
+                                    category_id=c % 3 + 1, created_at=base_time))
+            course_lessons[course_id], course_quizzes[course_id], course_assignments[course_id] = [], [], []
+            for m in range(modules):
+                module_id = len(module_rows) + 1
+                module_rows.append(dict(id=module_id, title=f'Module {m + 1}', order_index=m, course_id=course_id))
+                for l in range(lessons):
+                    lesson_id = len(lesson_rows) + 1
+                    lesson_rows.append(dict(id=lesson_id, title=f'Lesson {m + 1}.{l + 1}', order_index=l,
+                                            module_id=module_id, content='Lorem ipsum ' * rng.randint(20, 200),
+                                            video_url='https://www.youtube.com/embed/dQw4w9WgXcQ'))
+                    course_lessons[course_id].append(lesson_id)
+                    if quiz_every and lesson_id % quiz_every == 0:
+                        quiz_id = len(quiz_rows) + 1
+                        quiz_rows.append(dict(id=quiz_id, title=f'Quiz {lesson_id}', lesson_id=lesson_id,
+                                              created_at=base_time))
+                        answers = []
+                        for q in range(questions):
+                            correct = rng.randrange(4)
+                            question_rows.append(dict(id=len(question_rows) + 1, quiz_id=quiz_id,
+                                                      question_text=f'Question {q + 1} of quiz {quiz_id}?',
+                                                      options=json.dumps([f'Option {o + 1}' for o in range(4)]),
+                                                      correct_option=correct))
+                            answers.append((len(question_rows), correct))
+                        course_quizzes[course_id].append((quiz_id, answers))
+                    if assignment_every and lesson_id % assignment_every == 0:
+                        assignment_id = len(assignment_rows) + 1
+                        assignment_rows.append(dict(id=assignment_id, lesson_id=lesson_id, max_score=100,
+                                                    instructions=f'Hand in the exercise for lesson {lesson_id}.',
+                                                    created_at=base_time))
+                        course_assignments[course_id].append(assignment_id)
+
+        _bulk(db, Course, course_rows)
+        _bulk(db, Module, module_rows)
+        _bulk(db, Lesson, lesson_rows)
+        _bulk(db, Quiz, quiz_rows)
+        _bulk(db, Question, question_rows)
+        _bulk(db, Assignment, assignment_rows)
+
+        # Upload blobs shared by the submissions
+        blob_rows = []
+        for i in range(files):
+            content = rng.randbytes(file_kb * 1024)
+            digest = hashlib.sha256(content).hexdigest()
+            path = blob_path(digest, f'bench_{i}.pdf')
+            os.makedirs(os.path.join(upload_root, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(upload_root, path), 'wb') as f:
+                f.write(content)
+            blob_rows.append(dict(sha256=digest, path=path, original_name=f'bench_{i}.pdf', size=len(content),
+                                  ref_count=0, created_at=base_time))
+
+        enrollment_rows, progress_rows, result_rows, submission_rows = [], [], [], []
+        for user_id in student_ids:
+            for course_id in rng.sample(range(1, courses + 1), min(enrollments_per_user, courses)):
+                enrollment_rows.append(dict(user_id=user_id, course_id=course_id))
+                for lesson_id in course_lessons[course_id]:
+                    if rng.random() < progress_rate:
+                        progress_rows.append(dict(user_id=user_id, lesson_id=lesson_id, is_completed=True,
+                                                  completed_at=base_time + timedelta(hours=rng.randint(1, 5000))))
+                for quiz_id, answers in course_quizzes[course_id]:
+                    for _ in range(rng.randint(0, attempts)):
+                        chosen = {str(qid): (correct if rng.random() < 0.7 else rng.randrange(4)) for qid, correct in answers}
+                        score = int(sum(chosen[str(qid)] == correct for qid, correct in answers) * 100 / len(answers)) if answers else 0
+                        result_rows.append(dict(user_id=user_id, quiz_id=quiz_id, score=score, passed=score >= 70,
+                                                answers=json.dumps(chosen),
+                                                attempted_at=base_time + timedelta(hours=rng.randint(1, 5000))))
+                for assignment_id in course_assignments[course_id]:
+                    if blob_rows and rng.random() < submission_rate:
+                        blob = rng.choice(blob_rows)
+                        blob['ref_count'] += 1
+                        submission_rows.append(dict(user_id=user_id, assignment_id=assignment_id, file_path=blob['path'],
+                                                    grade=rng.choice([None, rng.randint(40, 100)]),
+                                                    submitted_at=base_time + timedelta(hours=rng.randint(1, 5000))))
+
+        _bulk(db, UploadBlob, blob_rows)
+        _bulk(db, enrollments, enrollment_rows)
+        _bulk(db, LessonProgress, progress_rows)
+        _bulk(db, QuizResult, result_rows)
+        _bulk(db, Submission, submission_rows)
+        rebuild_scores()
+        db.session.commit()
+
+        counts = {
+            'users': len(user_rows), 'courses': len(course_rows), 'modules': len(module_rows),
+            'lessons': len(lesson_rows), 'quizzes': len(quiz_rows), 'questions': len(question_rows),
+            'assignments': len(assignment_rows), 'enrollments': len(enrollment_rows),
+            'lesson_progress': len(progress_rows), 'quiz_results': len(result_rows),
+            'submissions': len(submission_rows), 'upload_files': len(blob_rows),
+        }
+    return counts
+
+
+@click.command()
+@click.option('--users', default=500, show_default=True)
+@click.option('--courses', default=10, show_default=True)
+@click.option('--modules', default=4, show_default=True, help='Modules per course.')
+@click.option('--lessons', default=5, show_default=True, help='Lessons per module.')
+@click.option('--quiz-every', default=2, show_default=True, help='Every Nth lesson has a quiz (0 for none).')
+@click.option('--questions', default=5, show_default=True, help='Questions per quiz.')
+@click.option('--assignment-every', default=3, show_default=True, help='Every Nth lesson has an assignment (0 for none).')
+@click.option('--enrollments', 'enrollments_per_user', default=3, show_default=True, help='Courses per student.')
+@click.option('--attempts', default=2, show_default=True, help='Max quiz attempts per student and quiz.')
+@click.option('--submission-rate', default=0.5, show_default=True)
+@click.option('--progress-rate', default=0.4, show_default=True, help='Share of lessons completed.')
+@click.option('--files', default=50, show_default=True, help='Distinct upload files shared by the submissions.')
+@click.option('--file-kb', default=64, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+def main(**options):
+    """Rebuild the benchmark database with synthetic data."""
+    app = bench_app()
+    started = time.perf_counter()
+    counts = generate(app, **options)
+    click.echo(json.dumps({'database': app.config['SQLALCHEMY_DATABASE_URI'], 'seconds': round(time.perf_counter() - started, 2),
+                           'options': options, 'rows': counts}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
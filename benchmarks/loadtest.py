@@ -0,0 +1,280 @@
+import http.cookiejar
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime
+
+import click
+
+from benchmarks import ROOT, BENCH_PASSWORD, bench_app, bench_env, student_email
+
+# One virtual user logs in as a synthetic student, then repeats the scenario below. Every
+# request is timed and tagged with the X-Query-Count the app reports (QUERY_STATS_HEADERS).
+ROUTES = ['login', 'dashboard', 'course_view', 'lesson_player', 'quiz_submit', 'upload']
+
+
+# --- Clients ---
+
+class WSGIClient:
+    """Calls the app in-process through Flask's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, files=None):
+        form = dict(data or {})
+        for field, (filename, content) in (files or {}).items():
+            form[field] = (io.BytesIO(content), filename)
+        response = self.client.open(path, method=method, data=form or None,
+                                    content_type='multipart/form-data' if files else None)
+        response.close()
+        return response.status_code, response.headers
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """Talks to a running server (gunicorn or any other) with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None, files=None):
+        headers = {}
+        body = None
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for name, value in (data or {}).items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+            for name, (filename, content) in files.items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                             f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+            parts.append(f'--{boundary}--\r\n'.encode())
+            body = b''.join(parts)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status, response.headers
+        except urllib.error.HTTPError as e: # Includes the 302s we chose not to follow
+            e.read()
+            return e.code, e.headers
+
+
+# --- Workload ---
+
+def build_plans(app, count, seed):
+    """For each virtual user: a student login plus the course, lessons, quiz answers and assignments it will hit."""
+    from app import db
+    from app.models import User, Module, Lesson, Quiz, Question, Assignment, enrollments
+
+    rng = random.Random(seed)
+    plans = []
+    with app.app_context():
+        total_students = User.query.filter_by(role='student').count()
+        if not total_students:
+            raise click.ClickException('No students found; run `python -m benchmarks.datagen` first.')
+        for v in range(count):
+            index = rng.randrange(total_students)
+            user = User.query.filter_by(email=student_email(index)).first()
+            course_ids = [cid for (cid,) in db.session.execute(
+                db.select(enrollments.c.course_id).where(enrollments.c.user_id == user.id))]
+            if not course_ids:
+                continue
+            course_id = rng.choice(course_ids)
+            lesson_ids = [lid for (lid,) in db.session.query(Lesson.id).join(Module).filter(Module.course_id == course_id)]
+            quizzes = []
+            for quiz in Quiz.query.filter(Quiz.lesson_id.in_(lesson_ids)).all():
+                questions = [(q.id, len(json.loads(q.options))) for q in Question.query.filter_by(quiz_id=quiz.id)]
+                quizzes.append((quiz.lesson_id, questions))
+            assignment_lessons = [lid for (lid,) in db.session.query(Assignment.lesson_id)
+                                  .filter(Assignment.lesson_id.in_(lesson_ids))]
+            plans.append({'email': user.email, 'course_id': course_id, 'lesson_ids': lesson_ids,
+                          'quizzes': quizzes, 'assignment_lessons': assignment_lessons})
+    return plans
+
+
+def run_user(client, plan, iterations, warmup, upload_rate, upload_kb, seed, record):
+    rng = random.Random(seed)
+
+    def timed(route, method, path, recorded=True, **kwargs):
+        started = time.perf_counter()
+        status, headers = client.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - started
+        if recorded:
+            queries = headers.get('X-Query-Count')
+            record.append((route, elapsed, status, int(queries) if queries is not None else None))
+        return status
+
+    status = timed('login', 'POST', '/login', data={'email': plan['email'], 'password': BENCH_PASSWORD})
+    if status >= 400:
+        return
+
+    for i in range(warmup + iterations):
+        recorded = i >= warmup
+        timed('dashboard', 'GET', '/student/dashboard', recorded)
+        timed('course_view', 'GET', f"/course/{plan['course_id']}", recorded)
+        timed('lesson_player', 'GET', f"/lesson/{rng.choice(plan['lesson_ids'])}", recorded)
+        if plan['quizzes']:
+            lesson_id, questions = rng.choice(plan['quizzes'])
+            answers = {f'question_{qid}': str(rng.randrange(options)) for qid, options in questions}
+            timed('quiz_submit', 'POST', f'/lesson/{lesson_id}/quiz/submit', recorded, data=answers)
+        if plan['assignment_lessons'] and rng.random() < upload_rate:
+            lesson_id = rng.choice(plan['assignment_lessons'])
+            content = rng.randbytes(upload_kb * 1024)
+            timed('upload', 'POST', f'/lesson/{lesson_id}/assignment/upload', recorded,
+                  files={'file': (f'bench_{uuid.uuid4().hex[:8]}.pdf', content)})
+
+
+# --- Reporting ---
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(records, wall_seconds):
+    routes = {}
+    for route in ROUTES:
+        rows = [r for r in records if r[0] == route]
+        if not rows:
+            continue
+        latencies = sorted(r[1] * 1000 for r in rows)
+        queries = [r[3] for r in rows if r[3] is not None]
+        routes[route] = {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if r[2] >= 400),
+            'throughput_rps': round(len(rows) / wall_seconds, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return {
+        'requests': len(records),
+        'errors': sum(1 for r in records if r[2] >= 400),
+        'wall_seconds': round(wall_seconds, 2),
+        'throughput_rps': round(len(records) / wall_seconds, 2) if wall_seconds else None,
+        'routes': routes,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- gunicorn ---
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), '-w', str(workers),
+         '-b', f'127.0.0.1:{port}', 'run:app'],
+        cwd=ROOT, env=bench_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(f'gunicorn exited: {process.stderr.read().decode()[-2000:]}')
+        try:
+            urllib.request.urlopen(url + '/login', timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise click.ClickException('gunicorn did not start within 30s')
+
+
+@click.command()
+@click.option('--concurrency', default=4, show_default=True, help='Virtual users running at the same time.')
+@click.option('--iterations', default=10, show_default=True, help='Scenario repetitions per virtual user.')
+@click.option('--warmup', default=1, show_default=True, help='Unrecorded repetitions per virtual user.')
+@click.option('--upload-rate', default=0.3, show_default=True, help='Chance of an upload per repetition.')
+@click.option('--upload-kb', default=256, show_default=True)
+@click.option('--gunicorn', 'gunicorn_workers', default=0, help='Start a local gunicorn with this many workers.')
+@click.option('--url', default=None, help='Benchmark an already running server instead of the in-process app.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--out', type=click.Path(dir_okay=False), default=None, help='Write the JSON report here.')
+def main(concurrency, iterations, warmup, upload_rate, upload_kb, gunicorn_workers, url, seed, out):
+    """Drive the real routes with concurrent virtual users and report latency per route as JSON."""
+    app = bench_app()
+    plans = build_plans(app, concurrency, seed)
+
+    process = None
+    if gunicorn_workers:
+        process, url = start_gunicorn(gunicorn_workers)
+    target = url or 'wsgi'
+    try:
+        records = []
+        threads = []
+        for i, plan in enumerate(plans):
+            client = HTTPClient(url) if url else WSGIClient(app)
+            threads.append(threading.Thread(target=run_user, name=f'vu-{i}', args=(
+                client, plan, iterations, warmup, upload_rate, upload_kb, seed + i, records)))
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        'commit': git_commit(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'target': f'gunicorn x{gunicorn_workers}' if gunicorn_workers else target,
+        'database': app.config['SQLALCHEMY_DATABASE_URI'],
+        'options': {'concurrency': concurrency, 'iterations': iterations, 'warmup': warmup,
+                    'upload_rate': upload_rate, 'upload_kb': upload_kb, 'seed': seed},
+        **summarize(records, wall),
+    }
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+
+
+if __name__ == '__main__':
+    main()
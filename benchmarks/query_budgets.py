@@ -0,0 +1,258 @@
+import json
+import os
+
+import click
+
+from benchmarks import ROOT, BENCH_PASSWORD, student_email
+
+# Every route of the main, auth and admin_bp blueprints is declared here with the number of SQL
+# queries it may run. The harness renders each route against a small (10 lessons) and a large
+# (1000 lessons) dataset; a route passes when both counts are equal and within budget, i.e. its
+# cost does not grow with the data. New routes must be added here or the coverage check fails.
+#
+#   path       URL with {placeholders} filled from the dataset (see dataset_refs)
+#   role       'student', 'admin' or None (anonymous)
+#   data       form data for POSTs ({placeholders} allowed in values)
+#   status     expected status when not the default (200 for GETs, 200 or 302 for POSTs)
+#   scales     known to grow with the data (an N+1 still to fix); reported as an expected failure,
+#              with the budget set to what it costs on the small dataset
+#   skip       reason the route is not exercised (destructive or file-only)
+
+SIZES = {
+    'small': dict(users=5, courses=2, modules=1, lessons=5, enrollments_per_user=2, files=5),
+    'large': dict(users=100, courses=10, modules=10, lessons=10, enrollments_per_user=2, files=5),
+}
+
+ROUTES = {
+    # auth
+    'auth.login': dict(path='/login', role=None, budget=0),
+    'auth.register': dict(path='/register', role=None, budget=0),
+    'auth.logout': dict(path='/logout', role='student', status=302, budget=1),
+
+    # main (student)
+    'main.index': dict(path='/', role=None, budget=0),
+    'main.student_dashboard': dict(path='/student/dashboard', role='student', budget=23, scales=True),
+    'main.course_view': dict(path='/course/{course_id}', role='student', budget=22, scales=True),
+    'main.lesson_player': dict(path='/lesson/{lesson_id}', role='student', budget=14),
+    'main.course_leaderboard': dict(path='/course/{course_id}/leaderboard', role='student', budget=7),
+    'main.take_quiz': dict(path='/lesson/{quiz_lesson_id}/quiz', role='student', budget=4),
+    'main.view_quiz_result': dict(path='/quiz/{result_id}/result', role='student', budget=10),
+    'main.student_assignments': dict(path='/student/assignments', role='student', budget=8),
+    'main.student_quizzes': dict(path='/student/quizzes', role='student', budget=10),
+    'main.download_submission': dict(path='/submission/{submission_id}/download', role='student', budget=3),
+    'main.download_assignment_resource': dict(path='/assignment/{assignment_id}/resource', role='student', budget=7),
+    'main.mark_complete': dict(path='/lesson/{lesson_id}/complete', method='POST', role='student', budget=9),
+    'main.video_heartbeat': dict(path='/lesson/{lesson_id}/heartbeat', method='POST', role='student',
+                                 data={'position': '30', 'duration': '600'}, budget=2),
+    'main.submit_quiz': dict(path='/lesson/{quiz_lesson_id}/quiz/submit', method='POST', role='student',
+                             data={'question_{question_id}': '0'}, budget=12),
+    'main.upload_assignment': dict(path='/lesson/{assignment_lesson_id}/assignment/upload', method='POST',
+                                   role='student', upload=True, budget=7),
+    'main.update_profile': dict(path='/student/profile/update', method='POST', role='student',
+                                data={'phone_number': '555-0100'}, budget=3),
+
+    # main (admin)
+    'main.dashboard': dict(path='/admin/dashboard', role='admin', budget=6),
+    'main.mark_notification_read': dict(path='/admin/notification/{notification_id}/read', method='POST',
+                                        role='admin', budget=3),
+    'main.mark_all_notifications_read': dict(path='/admin/notifications/read', method='POST', role='admin',
+                                             data={'up_to': '{notification_id}'}, budget=3),
+    'main.reject_assignment': dict(skip='destructive: releases the submission file'),
+
+    # admin_bp
+    'admin_bp.students': dict(path='/admin/students', role='admin', budget=11, scales=True),
+    'admin_bp.categories': dict(path='/admin/categories', role='admin', budget=5),
+    'admin_bp.courses': dict(path='/admin/courses', role='admin', budget=3),
+    'admin_bp.course_content': dict(path='/admin/course/{course_id}/content', role='admin', budget=18, scales=True),
+    'admin_bp.course_gradebook': dict(path='/admin/course/{course_id}/gradebook', role='admin', budget=7),
+    'admin_bp.export_gradebook': dict(path='/admin/course/{course_id}/gradebook.csv', role='admin', budget=3),
+    'admin_bp.all_quizzes': dict(path='/admin/quizzes', role='admin', budget=21, scales=True),
+    'admin_bp.all_assignments': dict(path='/admin/assignments', role='admin', budget=16, scales=True),
+    'admin_bp.assignment_submissions': dict(path='/admin/assignment/{assignment_id}/submissions', role='admin',
+                                            budget=9, scales=True),
+    'admin_bp.download_all_submissions': dict(path='/admin/assignment/{assignment_id}/submissions/download',
+                                              role='admin', budget=4),
+    'admin_bp.add_quiz': dict(path='/admin/lesson/{quiz_lesson_id}/add_quiz', role='admin', budget=6),
+    'admin_bp.edit_lesson': dict(path='/admin/lesson/{lesson_id}/edit', role='admin', budget=4),
+    'admin_bp.analytics': dict(path='/admin/analytics?days=365', role='admin', budget=5),
+    'admin_bp.refresh_analytics': dict(path='/admin/analytics/refresh', method='POST', role='admin', budget=2),
+    'admin_bp.profiles': dict(path='/admin/profiles', role='admin', budget=1),
+    'admin_bp.view_profile': dict(skip='reads a profile file, no database work'),
+    'admin_bp.grade_submission': dict(path='/admin/submission/{submission_id}/grade', method='POST', role='admin',
+                                      data={'grade': '80', 'feedback': 'ok'}, budget=11),
+    'admin_bp.bulk_grade_submissions': dict(path='/admin/assignment/{assignment_id}/grades', method='POST',
+                                            role='admin', data={'table': '{submission_id},75'}, budget=9),
+    'admin_bp.add_module': dict(path='/admin/course/{course_id}/add_module', method='POST', role='admin',
+                                data={'title': 'Budget module'}, budget=5),
+    'admin_bp.add_lesson': dict(path='/admin/module/{module_id}/add_lesson', method='POST', role='admin',
+                                data={'title': 'Budget lesson'}, budget=7),
+    'admin_bp.add_assignment': dict(skip='creates a second assignment for an existing lesson'),
+    'admin_bp.edit_assignment': dict(path='/admin/assignment/{assignment_id}/edit', method='POST', role='admin',
+                                     data={'instructions': 'Updated', 'max_score': '100'}, budget=10),
+    'admin_bp.quick_add_content': dict(skip='creates content with files, covered by add_module/add_lesson'),
+    'admin_bp.approve_student': dict(path='/admin/student/{user_id}/approve', method='POST', role='admin', budget=3),
+    'admin_bp.reject_student': dict(skip='would lock the measuring student out'),
+    'admin_bp.toggle_student_status': dict(skip='would lock the measuring student out'),
+    'admin_bp.enroll_student': dict(path='/admin/student/{user_id}/enroll', method='POST', role='admin',
+                                    data={'course_id': '{course_id}'}, budget=4),
+    'admin_bp.unenroll_student': dict(skip='would remove the measuring student from the course'),
+    'admin_bp.change_student_password': dict(skip='changes the measuring password (bcrypt-bound)'),
+    'admin_bp.reveal_student_password': dict(skip='bcrypt-bound, constant by construction'),
+    'admin_bp.delete_assignment': dict(skip='destructive'),
+    'admin_bp.delete_category': dict(skip='destructive'),
+    'admin_bp.delete_course': dict(skip='destructive'),
+    'admin_bp.delete_lesson': dict(skip='destructive'),
+    'admin_bp.delete_quiz': dict(skip='destructive'),
+}
+
+BLUEPRINTS = ('main', 'auth', 'admin_bp')
+
+
+def budget_env(size, directory):
+    """Environment for the budget app of one dataset size, with its database and uploads in directory."""
+    return {
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, f'budget_{size}.db')}",
+        'UPLOAD_FOLDER': os.path.join(directory, f'budget_{size}_uploads'),
+        'PROFILE_SAMPLE_RATE': '0',
+    }
+
+
+def budget_app(size):
+    """An app seeded with the given dataset size, bound to the database of the current environment.
+
+    Set budget_env() first: generate() drops that database and its upload folder.
+    """
+    from app import create_app
+    from app.fragment_cache import NullCache
+    from benchmarks.datagen import generate
+
+    app = create_app()
+    app.config['QUERY_STATS_HEADERS'] = True
+    app.jinja_env.fragment_cache = NullCache() # Count what a cold render costs
+    generate(app, **SIZES[size])
+    return app
+
+
+def dataset_refs(app):
+    """Ids the route paths refer to, all reachable by the measuring student (student 0)."""
+    from app import db
+    from app.models import (User, Module, Lesson, Quiz, Question, Assignment, Submission, QuizResult,
+                            Notification, UploadBlob, enrollments)
+
+    with app.app_context():
+        student = User.query.filter_by(email=student_email(0)).first()
+        course_id = db.session.execute(
+            db.select(enrollments.c.course_id).where(enrollments.c.user_id == student.id)
+            .order_by(enrollments.c.course_id)).scalars().first()
+        lesson_ids = db.session.query(Lesson.id).join(Module).filter(Module.course_id == course_id)
+        quiz = Quiz.query.filter(Quiz.lesson_id.in_(lesson_ids)).order_by(Quiz.id).first()
+        assignment = Assignment.query.filter(Assignment.lesson_id.in_(lesson_ids)).order_by(Assignment.id).first()
+        submission = Submission.query.filter_by(user_id=student.id, assignment_id=assignment.id).first()
+        if submission is None:
+            blob = UploadBlob.query.first()
+            submission = Submission(user_id=student.id, assignment_id=assignment.id, file_path=blob.path)
+            blob.ref_count += 1
+            db.session.add(submission)
+        result = QuizResult.query.filter_by(user_id=student.id, quiz_id=quiz.id).first()
+        if result is None:
+            result = QuizResult(user_id=student.id, quiz_id=quiz.id, score=50, answers='{}')
+            db.session.add(result)
+        assignment.resource_path = submission.file_path
+        notification = Notification(message='Budget notification')
+        db.session.add(notification)
+        db.session.commit()
+
+        return {
+            'user_id': student.id,
+            'course_id': course_id,
+            'module_id': Module.query.filter_by(course_id=course_id).first().id,
+            'lesson_id': assignment.lesson_id,
+            'quiz_lesson_id': quiz.lesson_id,
+            'question_id': Question.query.filter_by(quiz_id=quiz.id).first().id,
+            'assignment_id': assignment.id,
+            'assignment_lesson_id': assignment.lesson_id,
+            'submission_id': submission.id,
+            'result_id': result.id,
+            'notification_id': notification.id,
+        }
+
+
+def _clients(app):
+    clients = {None: app.test_client(), 'student': app.test_client(), 'admin': app.test_client()}
+    clients['student'].post('/login', data={'email': student_email(0), 'password': BENCH_PASSWORD})
+    clients['admin'].post('/login', data={'email': 'admin@bench.local', 'password': BENCH_PASSWORD})
+    return clients
+
+
+def measure(app, refs):
+    """{endpoint: (status, query count)} for every declared route.
+
+    Counts are taken when the response is built, so the rows a streamed body fetches later
+    (the gradebook export) are not included.
+    """
+    import io
+    clients = _clients(app)
+    # GETs first so the POSTs' writes don't feed into them; logging out ends the student session, so last
+    declared = sorted((e for e, spec in ROUTES.items() if 'skip' not in spec),
+                      key=lambda e: (e == 'auth.logout', ROUTES[e].get('method', 'GET') != 'GET', e))
+    counts = {}
+    for endpoint in declared:
+        spec = ROUTES[endpoint]
+        data = {k.format(**refs): v.format(**refs) for k, v in (spec.get('data') or {}).items()}
+        if spec.get('upload'):
+            data['file'] = (io.BytesIO(b'%PDF-1.4 budget'), 'budget.pdf')
+        client = clients[spec['role']]
+        response = client.open(spec['path'].format(**refs), method=spec.get('method', 'GET'), data=data or None)
+        response.close()
+        counts[endpoint] = (response.status_code, int(response.headers.get('X-Query-Count', 0)))
+    return counts
+
+
+def undeclared_routes(app):
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint.split('.')[0] in BLUEPRINTS and rule.endpoint not in ROUTES)
+
+
+def check(small, large):
+    """Problems per endpoint: status errors, growth between sizes, budget overruns."""
+    problems = {}
+    for endpoint, (status, count) in large.items():
+        spec = ROUTES[endpoint]
+        small_status, small_count = small[endpoint]
+        issues = []
+        # A GET that redirects (e.g. to the login page) measured nothing
+        expected = (spec['status'],) if 'status' in spec else (200,) if spec.get('method', 'GET') == 'GET' else (200, 302)
+        if status not in expected or small_status not in expected:
+            issues.append(f'status {small_status}/{status}')
+        if count != small_count:
+            issues.append(f'{small_count} queries with 10 lessons, {count} with 1000')
+        if count > spec['budget']:
+            issues.append(f"{count} queries, budget {spec['budget']}")
+        if issues:
+            problems[endpoint] = issues
+    return problems
+
+
+@click.command()
+def main():
+    """Measure every route at both dataset sizes and print the counts and problems as JSON."""
+    results = {}
+    for size in SIZES:
+        os.environ.update(budget_env(size, os.path.join(ROOT, 'instance')))
+        app = budget_app(size)
+        results[size] = measure(app, dataset_refs(app))
+    problems = check(results['small'], results['large'])
+    report = {
+        endpoint: {'budget': ROUTES[endpoint]['budget'], 'small': results['small'][endpoint][1],
+                   'large': results['large'][endpoint][1], 'scales': ROUTES[endpoint].get('scales', False),
+                   'problems': problems.get(endpoint, [])}
+        for endpoint in sorted(results['large'])
+    }
+    click.echo(json.dumps(report, indent=2))
+    unexpected = [e for e in problems if not ROUTES[e].get('scales')]
+    if unexpected:
+        raise SystemExit(f"Over budget: {', '.join(unexpected)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Query-budget regression tests: python -m pytest benchmarks/test_query_budgets.py
+
+Each route is rendered against a 10-lesson and a 1000-lesson dataset (see query_budgets.py);
+routes flagged scales=True are known N+1s and run as strict expected failures, so fixing one
+turns its test red until the flag is removed.
+"""
+import pytest
+
+from benchmarks.query_budgets import (ROUTES, SIZES, budget_env, budget_app, dataset_refs, measure, undeclared_routes,
+                                      check)
+
+MEASURED = sorted(e for e, spec in ROUTES.items() if 'skip' not in spec)
+
+
+@pytest.fixture(scope='session')
+def counts(tmp_path_factory):
+    results = {}
+    directory = str(tmp_path_factory.mktemp('budgets'))
+    # Only while the apps are built and measured; nothing else in the session sees these databases
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for size in SIZES:
+            for name, value in budget_env(size, directory).items():
+                monkeypatch.setenv(name, value)
+            app = budget_app(size)
+            results[size] = measure(app, dataset_refs(app))
+            results['app'] = app
+    return results
+
+
+def test_every_route_has_a_budget(counts):
+    assert undeclared_routes(counts['app']) == []
+
+
+@pytest.mark.parametrize('endpoint', [
+    pytest.param(e, marks=pytest.mark.xfail(strict=True, reason='known N+1')) if ROUTES[e].get('scales') else e
+    for e in MEASURED
+])
+def test_query_budget(counts, endpoint):
+    problems = check({endpoint: counts['small'][endpoint]}, {endpoint: counts['large'][endpoint]})
+    assert problems.get(endpoint) is None, problems.get(endpoint)
@@ -0,0 +1,24 @@
+# gunicorn settings for `gunicorn run:app`
+import os
+import shutil
+
+# Prometheus multiprocess metrics (app/metrics.py) live in per-worker files. Set here, before the
+# app is loaded, so every worker and the app's init_metrics() use the same directory
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'prometheus'),
+)
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to this one
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,46 @@
+from app import create_app, db
+from app.models import UploadBlob
+from app.storage import hash_file, ingest_file, is_blob, UPLOAD_REFERENCES
+import os
+
+app = create_app()
+
+def migrate():
+    with app.app_context():
+        upload_folder = app.config['UPLOAD_FOLDER']
+
+        # 1. Hash every flat file and move it into the blob store (duplicates are discarded)
+        moved = {}
+        duplicates = 0
+        with os.scandir(upload_folder) as entries:
+            flat_files = [e for e in entries if e.is_file() and not e.name.startswith('.')]
+
+        for entry in flat_files:
+            digest = hash_file(entry.path)
+            if db.session.get(UploadBlob, digest) is not None:
+                duplicates += 1
+            moved[entry.name] = ingest_file(entry.path, digest, entry.stat().st_size, entry.name, ref_delta=0)
+        db.session.commit()
+        print(f"Hashed {len(flat_files)} files, {duplicates} duplicates removed.")
+
+        # 2. Point every referencing row at its blob and recount the references from scratch
+        UploadBlob.query.update({UploadBlob.ref_count: 0})
+        rewritten = 0
+        for model, column in UPLOAD_REFERENCES:
+            for row in model.query.filter(getattr(model, column).isnot(None)).all():
+                path = getattr(row, column)
+                if not is_blob(path) and path in moved:
+                    path = moved[path]
+                    setattr(row, column, path)
+                    rewritten += 1
+                if is_blob(path):
+                    blob = UploadBlob.query.filter_by(path=path).first()
+                    if blob:
+                        blob.ref_count += 1
+
+        db.session.commit()
+        unreferenced = UploadBlob.query.filter_by(ref_count=0).count()
+        print(f"Rewrote {rewritten} references. {unreferenced} blobs are unreferenced.")
+
+if __name__ == '__main__':
+    migrate()
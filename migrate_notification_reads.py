@@ -0,0 +1,47 @@
+from app import create_app, db
+from app.models import User
+from app.notifications import mark_all_read, mark_read
+from sqlalchemy import text
+
+app = create_app()
+
+def migrate():
+    with app.app_context():
+        # 1. Columns for coalescing (NotificationCursor / NotificationRead are created by create_app)
+        columns = {c['name'] for c in db.inspect(db.engine).get_columns('notification')}
+        if 'is_read' not in columns:
+            print("Notification table is already migrated.")
+            return
+        with db.engine.begin() as conn:
+            if 'group_key' not in columns:
+                conn.execute(text("ALTER TABLE notification ADD COLUMN group_key VARCHAR(100)"))
+                conn.execute(text("ALTER TABLE notification ADD COLUMN count INTEGER NOT NULL DEFAULT 1"))
+                conn.execute(text("ALTER TABLE notification ADD COLUMN updated_at DATETIME"))
+            conn.execute(text("UPDATE notification SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) "
+                              "WHERE updated_at IS NULL"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notification_group_key ON notification (group_key)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notification_updated_at ON notification (updated_at)"))
+
+        # 2. The shared is_read flag becomes every admin's read state: a cursor below the first
+        #    unread notification and single dismissals for the read ones above it
+        first_unread = db.session.execute(
+            text("SELECT MIN(id) FROM notification WHERE is_read IS NULL OR is_read = 0")).scalar()
+        last = db.session.execute(text("SELECT MAX(id) FROM notification")).scalar() or 0
+        cursor = first_unread - 1 if first_unread else last
+        read_above = db.session.execute(
+            text("SELECT id FROM notification WHERE is_read = 1 AND id > :cursor"), {'cursor': cursor}).scalars().all()
+        admins = db.session.execute(db.select(User.id).where(User.role == 'admin')).scalars().all()
+        for admin_id in admins:
+            mark_all_read(admin_id, cursor)
+            for notification_id in read_above:
+                mark_read(admin_id, notification_id)
+        db.session.commit()
+        print(f"Read state copied to {len(admins)} admins (cursor {cursor}, {len(read_above)} single reads).")
+
+        # 3. Drop the shared flag (SQLite 3.35+)
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE notification DROP COLUMN is_read"))
+        print("Dropped notification.is_read.")
+
+if __name__ == '__main__':
+    migrate()
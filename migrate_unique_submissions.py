@@ -0,0 +1,44 @@
+from app import create_app, db
+from app.models import Submission
+from app.storage import release_upload
+from app.leaderboard import rebuild_scores
+from sqlalchemy import text
+
+app = create_app()
+
+def migrate():
+    with app.app_context():
+        # 1. Keep one submission per (student, assignment): the graded one if any, else the latest
+        duplicated = db.session.execute(
+            db.select(Submission.user_id, Submission.assignment_id)
+            .group_by(Submission.user_id, Submission.assignment_id)
+            .having(db.func.count() > 1)
+        ).all()
+        removed = 0
+        for user_id, assignment_id in duplicated:
+            rows = Submission.query.filter_by(user_id=user_id, assignment_id=assignment_id).order_by(
+                Submission.grade.is_(None), Submission.submitted_at.desc(), Submission.id.desc()).all()
+            for extra in rows[1:]:
+                release_upload(extra.file_path)
+                db.session.delete(extra)
+                removed += 1
+        db.session.flush()
+        if removed:
+            rebuild_scores() # Grades of the removed rows no longer count
+        db.session.commit()
+        print(f"Removed {removed} duplicate submissions for {len(duplicated)} (student, assignment) pairs.")
+
+        # 2. Databases created before the constraint get it as a unique index (same conflict target)
+        inspector = db.inspect(db.engine)
+        columns = ['user_id', 'assignment_id']
+        if any(c['column_names'] == columns for c in inspector.get_unique_constraints('submission')) or \
+                any(i['unique'] and i['column_names'] == columns for i in inspector.get_indexes('submission')):
+            print("Submission already has its unique constraint.")
+            return
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE UNIQUE INDEX unique_user_assignment_submission "
+                              "ON submission (user_id, assignment_id)"))
+        print("Added unique index on submission (user_id, assignment_id).")
+
+if __name__ == '__main__':
+    migrate()